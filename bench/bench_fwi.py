@@ -0,0 +1,74 @@
+"""Compares the scalar FWI functions in src/fwi.py with the array versions in src/fwi_np.py
+
+Usage: python bench/bench_fwi.py [n]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src import fwi, fwi_np
+
+REFERENCE = [
+    ("FFMC", (17, 42, 25, 0, 85), 87.692980092774448),
+    ("DMC", (17, 42, 0, 6, 45.98, 4), 8.5450511359999997),
+    ("DC", (17, 0, 15, 45.98, 4), 19.013999999999999),
+    ("ISI", (25, 87.692980092774448), 10.853661073655068),
+    ("BUI", (8.5450511359999997, 19.013999999999999), 8.4904265358371838),
+    ("FWI", (10.853661073655068, 8.4904265358371838), 10.096371392382368),
+    ("calcFWI", (4, 17, 42, 25, 0, 85, 6, 15, 45.98), 10.096371392382368),
+]
+
+
+def random_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return dict(
+        MONTH=rng.integers(1, 13, n),
+        TEMP=rng.uniform(-10, 40, n),
+        RH=rng.uniform(5, 100, n),
+        WIND=rng.uniform(0, 60, n),
+        # Roughly half the days dry, the rest spread over all the rain branches
+        RAIN=np.where(rng.random(n) < 0.5, 0.0, rng.exponential(5, n)),
+        FFMCPrev=rng.uniform(20, 99, n),
+        DMCPrev=rng.uniform(1, 200, n),
+        DCPrev=rng.uniform(15, 800, n),
+        LAT=rng.uniform(-89, 89, n),
+    )
+
+
+def check_reference():
+    for name, args, expected in REFERENCE:
+        scalar = getattr(fwi, name)(*args)
+        array = float(getattr(fwi_np, name)(*args))
+        assert np.isclose(scalar, expected, rtol=1e-12), (name, scalar, expected)
+        assert np.isclose(array, expected, rtol=1e-12), (name, array, expected)
+    print("Reference values: OK")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    check_reference()
+    inputs = random_inputs(n)
+    order = ["MONTH", "TEMP", "RH", "WIND", "RAIN", "FFMCPrev", "DMCPrev", "DCPrev", "LAT"]
+    rows = list(zip(*[inputs[k].tolist() for k in order]))
+
+    start = time.perf_counter()
+    scalar = np.array([fwi.calcFWI(*row) for row in rows])
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    array = fwi_np.calcFWI(*[inputs[k] for k in order])
+    array_time = time.perf_counter() - start
+
+    assert np.allclose(scalar, array, rtol=1e-9, atol=1e-9), np.abs(scalar - array).max()
+    print("calcFWI on {} inputs".format(n))
+    print("  scalar loop: {:.3f} s ({:.0f} rows/s)".format(scalar_time, n / scalar_time))
+    print("  numpy:       {:.3f} s ({:.0f} rows/s)".format(array_time, n / array_time))
+    print("  speedup:     {:.1f}x".format(scalar_time / array_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Checks the table based FFMC, ISI and calcFWI in src/fwi_fast.py against src/fwi_np.py and compares their speed
+
+Asserts that the largest absolute error on n random inputs is within fwi_fast.MAX_ERROR, then times
+both at sizes from a single row (as /predict computes) to a million (a large raster or backfill block).
+Below fwi_fast.MIN_ROWS the fast functions call fwi_np, so the speedup there is about 1x.
+
+Usage: python bench/bench_fwi_fast.py [n]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src import fwi_fast, fwi_np
+from bench_fwi import REFERENCE, random_inputs
+
+
+SIZES = (1, 96, 8192, 65536, 262144, 1000000)
+
+
+def timed(functions, args, repeat=3):
+    """Best time of each of functions on args, alternating between them so both see the same load"""
+    best = [float("inf")] * len(functions)
+    for _ in range(repeat):
+        for i, function in enumerate(functions):
+            start = time.perf_counter()
+            function(*args)
+            best[i] = min(best[i], time.perf_counter() - start)
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    start = time.perf_counter()
+    fwi_fast.load()
+    print("Tables mapped from {} in {:.3f} s".format(fwi_fast.TABLES, time.perf_counter() - start))
+
+    for name, args, expected in REFERENCE:
+        if name in fwi_fast.MAX_ERROR or name == "calcFWI":
+            value = float(getattr(fwi_fast, name)(*args))
+            assert abs(value - expected) <= fwi_fast.MAX_ERROR.get(name, fwi_fast.MAX_ERROR['FWI']), (name, value)
+    print("Reference values: OK")
+
+    inputs = random_inputs(n)
+    # Over the whole range the tables cover
+    inputs['TEMP'] = np.random.default_rng(1).uniform(-50, 60, n)
+    inputs['RH'] = np.random.default_rng(2).uniform(0, 100, n)
+    inputs['WIND'] = np.random.default_rng(3).uniform(0, 150, n)
+    inputs['FFMCPrev'] = np.random.default_rng(4).uniform(0, 101, n)
+    ffmc = ("TEMP", "RH", "WIND", "RAIN", "FFMCPrev")
+    cases = [
+        ("FFMC", [inputs[k] for k in ffmc]),
+        ("ISI", [inputs['WIND'], inputs['FFMCPrev']]),
+        ("calcFWI", [inputs[k] for k in ("MONTH",) + ffmc + ("DMCPrev", "DCPrev", "LAT")]),
+    ]
+    print("Largest absolute error on {} random inputs:".format(n))
+    for name, args in cases:
+        exact = getattr(fwi_np, name)(*args)
+        fast = getattr(fwi_fast, name)(*args)
+        error = np.nanmax(np.abs(fast - exact))
+        assert np.array_equal(np.isnan(fast), np.isnan(exact)), name
+        assert error <= fwi_fast.MAX_ERROR.get(name, fwi_fast.MAX_ERROR['FWI']), (name, error)
+        print("  {:8} {:.2g}".format(name, error))
+
+    print("Speedup over fwi_np (fast rows/s / exact rows/s):")
+    print("  {:>8} ".format("rows") + "".join("{:>10}".format(name) for name, _ in cases))
+    for size in SIZES:
+        if size > n:
+            break
+        repeat = max(9, 20000 // size)
+        line = "  {:8d} ".format(size)
+        for name, args in cases:
+            args = [a[:size] for a in args]
+            exact_time, fast_time = timed([getattr(fwi_np, name), getattr(fwi_fast, name)], args, repeat)
+            line += "{:9.2f}x".format(exact_time / fast_time)
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compares the NumPy forward pass in src/numpy_model.py with the Keras model it replaces
+
+Loads the same weights into both backends of InferenceEngine, scores the rows of data.csv and
+n random rows spread over the range of each column, and asserts that the largest absolute
+difference is within numpy_model.TOLERANCE. Needs keras, like the keras backend.
+
+Usage: python bench/bench_numpy_model.py [n] [weights]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from src.engine import InferenceEngine
+from src.features import COLUMNS, from_frame
+from src.numpy_model import TOLERANCE
+
+
+def random_rows(df, n, seed=0):
+    # Uniform between each column's smallest and largest value in data.csv
+    rng = np.random.default_rng(seed)
+    lo, hi = df[list(COLUMNS)].min().values, df[list(COLUMNS)].max().values
+    return rng.uniform(lo, hi, (n, len(COLUMNS))).astype(np.float32)
+
+
+def timed(engine, data):
+    start = time.perf_counter()
+    result = engine.predict(data)
+    return result, time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    weights = sys.argv[2] if len(sys.argv) > 2 else os.path.join(ROOT, "src", "model_weights.h5")
+    df = pd.read_csv(os.path.join(ROOT, "src", "data.csv"))
+    cases = [("data.csv", from_frame(df)), ("random", random_rows(df, n))]
+
+    engines = {backend: InferenceEngine(weights, backend=backend) for backend in ("numpy", "keras")}
+    print("Largest absolute difference from keras (TOLERANCE {:g}):".format(TOLERANCE))
+    for name, data in cases:
+        expected, keras_time = timed(engines['keras'], data)
+        result, numpy_time = timed(engines['numpy'], data)
+        error = float(np.abs(result - expected).max())
+        assert result.shape == expected.shape, (name, result.shape, expected.shape)
+        assert error <= TOLERANCE, (name, error)
+        print("  {:8} {:7d} rows  {:.2g}  keras {:.0f} rows/s, numpy {:.0f} rows/s".format(
+            name, len(data), error, len(data) / keras_time, len(data) / numpy_time))
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Load test for /predict at several concurrency levels, against a locally started server and stub weather.
+
+Starts src/stub_weather.py in-process (with configurable latency and error injection), starts the API
+as a subprocess pointed at it, then runs closed-loop asyncio clients that request points drawn from a
+realistic distribution inside the park bounds. Reports throughput, p50/p95/p99 latency and error rate
+for every level and for every second of the run, and saves everything as JSON.
+
+Usage: python bench/loadtest.py [--levels 10,100,1000] [--duration 20] [--server serve.py]
+                                [--weather-latency 0.1] [--weather-error-rate 0.02] [--out loadtest]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from src import stub_weather
+from src.grid import MONTESINHO
+
+# Fraction of requests around a few hotspots, the rest spread uniformly over the park
+HOTSPOTS = [(41.90, -6.85, 0.02), (41.80, -7.05, 0.03), (41.95, -6.65, 0.015)]
+HOTSPOT_SHARE = 0.7
+
+
+def coordinates(n, seed=0):
+    """Draws n (lat, lon) points inside the park bounds, clustered the way dragged markers are"""
+    rng = np.random.default_rng(seed)
+    g = MONTESINHO
+    lat = rng.uniform(g.y1, g.y2, n)
+    lon = rng.uniform(g.x1, g.x2, n)
+    hot = rng.random(n) < HOTSPOT_SHARE
+    which = rng.integers(0, len(HOTSPOTS), n)
+    centres = np.array(HOTSPOTS)[which]
+    lat = np.where(hot, rng.normal(centres[:, 0], centres[:, 2]), lat)
+    lon = np.where(hot, rng.normal(centres[:, 1], centres[:, 2]), lon)
+    return np.clip(lat, g.y1, g.y2), np.clip(lon, g.x1, g.x2)
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    p = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {'p50_ms': float(p[0]), 'p95_ms': float(p[1]), 'p99_ms': float(p[2])}
+
+
+async def run_level(url, concurrency, duration, timeout):
+    import aiohttp
+
+    lat, lon = coordinates(100000, seed=concurrency)
+    start = time.perf_counter()
+    end = start + duration
+    # (seconds since start, latency, ok) for every request
+    events = []
+
+    async def client(i, session):
+        k = i
+        while time.perf_counter() < end:
+            c = "'{:.6f},{:.6f}'".format(lat[k % len(lat)], lon[k % len(lon)])
+            k += concurrency
+            sent = time.perf_counter()
+            try:
+                async with session.get(url + "/predict", params={'c': c}) as resp:
+                    body = await resp.text()
+                    ok = resp.status == 200 and body != "Outside Bounds"
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                ok = False
+            done = time.perf_counter()
+            events.append((done - start, done - sent, ok))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        await asyncio.gather(*[client(i, session) for i in range(concurrency)])
+
+    elapsed = time.perf_counter() - start
+    ok = [latency for _, latency, success in events if success]
+    timeline = []
+    for second in range(int(np.ceil(elapsed))):
+        window = [e for e in events if second <= e[0] < second + 1]
+        good = [latency for _, latency, success in window if success]
+        timeline.append(dict({'second': second, 'requests': len(window), 'errors': len(window) - len(good)},
+                             **percentiles(good)))
+    return dict({
+        'concurrency': concurrency,
+        'duration_s': elapsed,
+        'requests': len(events),
+        'errors': len(events) - len(ok),
+        'error_rate': (len(events) - len(ok)) / len(events) if events else 0.0,
+        'throughput_rps': len(ok) / elapsed,
+    }, **percentiles(ok), timeline=timeline)
+
+
+def wait_ready(url, proc, timeout=60):
+    end = time.time() + timeout
+    while time.time() < end:
+        if proc.poll() is not None:
+            raise RuntimeError("Server exited with status {}".format(proc.returncode))
+        try:
+            urllib.request.urlopen(url + "/", timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Server didn't start within {} s".format(timeout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /predict against a local server")
+    parser.add_argument("--levels", default="10,100,1000", help="comma separated client counts")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per level")
+    parser.add_argument("--server", default="serve.py", help="script that starts the API (serve.py or main.py)")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--url", help="test an already running server instead of starting one")
+    parser.add_argument("--weather-latency", type=float, default=0.1)
+    parser.add_argument("--weather-jitter", type=float, default=0.05)
+    parser.add_argument("--weather-error-rate", type=float, default=0.0)
+    parser.add_argument("--weather-hang-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=30, help="client timeout per request")
+    parser.add_argument("--out", default="loadtest", help="directory to save the results in")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the server")
+    args = parser.parse_args()
+
+    stub = stub_weather.start(latency=args.weather_latency, jitter=args.weather_jitter,
+                              error_rate=args.weather_error_rate, hang_rate=args.weather_hang_rate)
+    proc = None
+    url = args.url
+    if url is None:
+        url = "http://127.0.0.1:{}".format(args.port)
+        env = dict(os.environ, PORT=str(args.port), WEATHER_URL=stub.url, GRID_REFRESH="0",
+                   FWI_STATE=os.path.join(os.path.abspath(args.out), "fwi_state.bin"))
+        env.update(kv.split("=", 1) for kv in args.env)
+        os.makedirs(args.out, exist_ok=True)
+        proc = subprocess.Popen([sys.executable, args.server], cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if proc is not None:
+            wait_ready(url, proc)
+        levels = []
+        for concurrency in map(int, args.levels.split(",")):
+            result = asyncio.run(run_level(url, concurrency, args.duration, args.timeout))
+            levels.append(result)
+            print("{:5d} clients: {:8.1f} req/s  p50 {:8.1f} ms  p95 {:8.1f} ms  p99 {:8.1f} ms  errors {:.2%}".format(
+                concurrency, result['throughput_rps'], result['p50_ms'] or 0, result['p95_ms'] or 0,
+                result['p99_ms'] or 0, result['error_rate']))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        stub.shutdown()
+
+    report = {
+        'time': time.time(),
+        'server': args.url or args.server,
+        'env': args.env,
+        'weather': {'latency': args.weather_latency, 'jitter': args.weather_jitter,
+                    'error_rate': args.weather_error_rate, 'hang_rate': args.weather_hang_rate,
+                    'upstream_requests': stub.requests},
+        'levels': levels,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, time.strftime("loadtest-%Y%m%d-%H%M%S.json"))
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Results written to", path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Offline benchmark suite for the FWI math, feature assembly, model inference and the /predict path.
+
+Every case is timed call by call after a warm-up, and reported as median and p99 latency plus
+throughput. Weather comes from an in-process stub, so no network access is needed.
+
+Usage: python bench/run.py [--out results.json] [--baseline baseline.json] [--threshold 1.2]
+                           [--filter fwi] [--quick]
+
+With --baseline, each case's median is compared against the saved run and the exit code is 1 if
+any case got slower by more than --threshold times.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+# main reads its configuration at import time
+os.environ.setdefault('FWI_STATE', os.path.join(tempfile.mkdtemp(), "fwi_state.bin"))
+os.environ.setdefault('GRID_REFRESH', "0")
+
+from src import fwi, fwi_fast, fwi_np, weather, stub_weather
+
+
+class StubProvider(weather.WeatherProvider):
+    """Answers instantly with the stub server's weather, without any HTTP
+
+    fetch_many() comes from WeatherProvider, so the grid refresh and
+    /predict/batch are stubbed too.
+    """
+
+    def fetch(self, lat, lon, url=None):
+        return stub_weather.weather(lat, lon, rain=True)
+
+
+def measure(fn, rows=1, seconds=1.0, warmup=0.2, max_calls=100000):
+    """Calls fn repeatedly and returns latency percentiles and throughput"""
+    end = time.perf_counter() + warmup
+    while time.perf_counter() < end:
+        fn()
+    samples = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end and len(samples) < max_calls:
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples)
+    total = samples.sum()
+    return {
+        'calls': len(samples),
+        'rows_per_call': rows,
+        'median_us': float(np.median(samples) * 1e6),
+        'p99_us': float(np.percentile(samples, 99) * 1e6),
+        'calls_per_sec': float(len(samples) / total),
+        'rows_per_sec': float(len(samples) * rows / total),
+    }
+
+
+def fwi_cases():
+    args = {
+        'FFMC': (17, 42, 25, 0, 85),
+        'DMC': (17, 42, 0, 6, 45.98, 4),
+        'DC': (17, 0, 15, 45.98, 4),
+        'ISI': (25, 87.692980092774448),
+        'BUI': (8.5450511359999997, 19.013999999999999),
+        'FWI': (10.853661073655068, 8.4904265358371838),
+        'calcFWI': (4, 17, 42, 25, 0, 85, 6, 15, 45.98),
+    }
+    for name, a in args.items():
+        f = getattr(fwi, name)
+        yield "fwi.scalar." + name, (lambda f=f, a=a: f(*a)), 1
+
+    n = 10000
+    rng = np.random.default_rng(0)
+    inputs = (rng.integers(1, 13, n), rng.uniform(-5, 35, n), rng.uniform(10, 100, n), rng.uniform(0, 50, n),
+              np.where(rng.random(n) < 0.5, 0.0, rng.exponential(5, n)), rng.uniform(30, 99, n),
+              rng.uniform(1, 200, n), rng.uniform(15, 800, n), np.full(n, 41.9))
+    yield "fwi.array.calcFWI", (lambda: fwi_np.calcFWI(*inputs)), n
+
+    # The tables are only used from fwi_fast.MIN_ROWS rows up, as for a 512x512 raster
+    n = 262144
+    rng = np.random.default_rng(0)
+    inputs = (rng.integers(1, 13, n), rng.uniform(-5, 35, n), rng.uniform(10, 100, n), rng.uniform(0, 50, n),
+              np.where(rng.random(n) < 0.5, 0.0, rng.exponential(5, n)), rng.uniform(30, 99, n))
+    yield "fwi.array.FFMC.262144", (lambda: fwi_np.FFMC(*inputs[1:])), n
+    yield "fwi.fast.FFMC.262144", (lambda: fwi_fast.FFMC(*inputs[1:])), n
+
+
+def feature_cases(main):
+    for n in (1, 1000):
+        X, Y, lat, lon = [np.resize(a, n) for a in main.MONTESINHO.cells()]
+        w = np.array([weather.parse_weather(stub_weather.weather(la, lo, rain=True)) for la, lo in zip(lat, lon)])
+        temp, rh, wind, rain = w.T
+        yield "features.{}".format(n), (lambda: main.features(X, Y, 10, 3, lat, temp, rh, wind, rain)), n
+
+
+def inference_cases(main):
+    rng = np.random.default_rng(0)
+    for n in (1, 64, 4096):
+        data = rng.uniform(0, 100, (n, 12))
+        yield "inference.{}.{}".format(main.engine.backend, n), (lambda data=data: main.engine.predict(data)), n
+
+
+def ok(resp):
+    # A failing request is fast, so it must not be timed as if it had worked
+    assert resp.status_code == 200, (resp.status_code, resp.get_data(as_text=True)[:500])
+    return resp
+
+
+def http_cases(main):
+    client = main.app.test_client()
+    yield "http.predict.cached", (lambda: ok(client.get("/predict?c='41.9,-6.85'"))), 1
+
+    def cold():
+        main.weather_cache.clear()
+        ok(client.get("/predict?c='41.9,-6.85'"))
+
+    yield "http.predict.uncached", cold, 1
+
+    rng = np.random.default_rng(0)
+    points = np.column_stack([rng.uniform(main.MONTESINHO.y1, main.MONTESINHO.y2, 100),
+                              rng.uniform(main.MONTESINHO.x1, main.MONTESINHO.x2, 100)]).tolist()
+    def batch():
+        results = ok(client.post("/predict/batch", json=points)).get_json()['results']
+        assert all('area' in r for r in results), [r for r in results if 'area' not in r][:3]
+
+    yield "http.predict_batch.100", batch, 100
+
+    def raster():
+        # The raster takes its weather from a grid snapshot. Made on first use, since /predict
+        # answers from the snapshot once there is one
+        if main.scheduler.snapshot is None:
+            # Kept in memory rather than written over the server's shared snapshot file
+            main.scheduler.path = None
+            main.scheduler.refresh()
+        main.raster_cache.clear()
+        ok(client.get("/raster?size=256"))
+
+    yield "http.raster.256", raster, 256 * 256
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print("\n{:32} {:>12} {:>12} {:>8}".format("case", "baseline us", "median us", "ratio"))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['median_us'] / baseline[name]['median_us']
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print("{:32} {:12.2f} {:12.2f} {:8.2f}{}".format(name, baseline[name]['median_us'],
+                                                         result['median_us'], ratio, flag))
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results saved with --out")
+    parser.add_argument("--threshold", type=float, default=1.2, help="median slowdown that counts as a regression")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="time each case for 0.2 s instead of 1 s")
+    args = parser.parse_args()
+
+    weather.provider = StubProvider()
+    import main as app_main
+
+    cases = [*fwi_cases(), *feature_cases(app_main), *inference_cases(app_main), *http_cases(app_main)]
+    seconds = 0.2 if args.quick else 1.0
+    results = {}
+    print("{:32} {:>12} {:>12} {:>14}".format("case", "median us", "p99 us", "rows/s"))
+    for name, fn, rows in cases:
+        if args.filter not in name:
+            continue
+        result = results[name] = measure(fn, rows, seconds=seconds, warmup=seconds / 5)
+        print("{:32} {:12.2f} {:12.2f} {:14.0f}".format(name, result['median_us'], result['p99_us'],
+                                                        result['rows_per_sec']))
+
+    report = {
+        'meta': {'time': time.time(), 'python': platform.python_version(), 'numpy': np.__version__,
+                 'machine': platform.machine(), 'platform': platform.platform()},
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print("\nResults written to", args.out)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.threshold)
+        if regressions:
+            print("\n{} case(s) regressed: {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
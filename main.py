@@ -1,17 +1,274 @@
 from flask import Flask
-from flask import request, make_response
+from flask import request, make_response, jsonify, g
 import numpy as np
 import os
 import datetime
+import hashlib
 import json
-import urllib.request
-from src.fwi import *
-from src.test import build_model
-from keras import backend as K
+import threading
+import time
+from src.batcher import MicroBatcher, Overloaded
+from src.cache import WeatherCache
+from src.engine import InferenceEngine
+from src.forecast import FORECAST_URL, daily, issued, rollout
+from src.features import COLUMNS, batch as feature_batch, buffer as feature_buffer, fill as fill_features
+from src.grid import MONTESINHO
+from src.metrics import REGISTRY
+from src.raster import colorize, interpolate, pixels, png
+from src.regions import Region, SpatialIndex, load_regions
+from src.registry import ModelRegistry, RegistryWatcher
+from src.scheduler import GridScheduler
+from src.state import FWIStateStore
+from src import whatif as what_if
+from src.weather import fetch_weather, fetch_many, parse_weather, fire_indices, moisture_codes, WeatherUnavailable
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app)
+models = ModelRegistry(os.environ.get('MODEL_REGISTRY', "./src/models"))
+# Serve the newest registered version if there is one, otherwise the fixed weights file
+_version, _weights = models.latest() or (None, os.environ.get('MODEL_WEIGHTS', "./src/model_weights.h5"))
+engine = InferenceEngine(_weights, backend=os.environ.get('MODEL_BACKEND', 'numpy'), version=_version)
+# After a swap the grid snapshot is rescored, so /predict and /grid serve the new model too
+watcher = RegistryWatcher(models, engine, interval=float(os.environ.get('MODEL_POLL', 10)),
+                          on_reload=lambda: scheduler.rescore_soon())
+weather_cache = WeatherCache(ttl=float(os.environ.get('WEATHER_TTL', 600)),
+                             maxsize=int(os.environ.get('WEATHER_CACHE_SIZE', 256)))
+batcher = MicroBatcher(engine.predict, window=float(os.environ.get('BATCH_WINDOW_MS', 0)) / 1000,
+                       max_batch=int(os.environ.get('BATCH_SIZE', 64)),
+                       max_queue=int(os.environ.get('BATCH_QUEUE', 1024)))
+# Rendered rasters, keyed by everything they depend on so entries are never stale
+raster_cache = WeatherCache(ttl=float('inf'), maxsize=int(os.environ.get('RASTER_CACHE_SIZE', 16)))
+RASTER_MAX = 2048
+# Pixels scored per pass, which bounds a render's memory whatever the raster size
+RASTER_BLOCK = int(os.environ.get('RASTER_BLOCK', 262144))
+# The grid's forecast weather, refetched every FORECAST_TTL seconds, and the predictions made from each issue
+FORECAST_DAYS = 5
+forecast_weather = WeatherCache(ttl=float(os.environ.get('FORECAST_TTL', 3600)), maxsize=1)
+forecast_results = WeatherCache(ttl=float('inf'), maxsize=8)
+state = FWIStateStore(os.environ.get('FWI_STATE', "./src/fwi_state.bin"), MONTESINHO.shape())
+
+# Montesinho is always region 0 and is served by the engine, state, batcher and grid scheduler above.
+# Regions from the REGIONS config file get their own model and state, loaded on first use and kept
+# for at most REGION_CACHE regions at a time
+regions = [Region("montesinho", MONTESINHO, engine.weights, state.path)]
+if os.environ.get('REGIONS'):
+    regions += load_regions(os.environ['REGIONS'], _weights, os.environ.get('REGION_STATE_DIR', "./src/state"))
+region_index = SpatialIndex(regions, bucket=float(os.environ.get('REGION_BUCKET', 0.5)))
+region_models = WeatherCache(ttl=float('inf'), maxsize=int(os.environ.get('REGION_CACHE', 8)))
+# Regions have no grid refresh, so scoring a cell directly advances its codes, at most once per WEATHER_TTL.
+# Monotonic time each (region, X, Y) was last advanced by this process
+region_advanced = {}
+region_advanced_lock = threading.Lock()
+
+STAGES = {stage: REGISTRY.histogram("predict_stage_seconds", "Time spent in each stage of a prediction", stage=stage)
+          for stage in ("parse", "snapshot", "weather", "fwi", "model")}
+RASTER_SECONDS = REGISTRY.histogram("raster_render_seconds", "Time taken to render a raster")
+OUTSIDE_BOUNDS = REGISTRY.counter("outside_bounds_total", "Requested points outside the park bounds")
+REGISTRY.gauge("model_load_seconds", "Time taken to load and warm up the model", fn=lambda: engine.load_time)
+REGISTRY.gauge("model_warmup_seconds", "Time taken by the warm-up prediction", fn=lambda: engine.warmup_time)
+REGISTRY.gauge("model_version", "Registry version of the active model, nan for the fixed weights file",
+               fn=lambda: engine.version if engine.version is not None else float("nan"))
+REGISTRY.gauge("model_reloads", "Model versions hot swapped in", fn=lambda: watcher.reloads)
+for _stat in ("hits", "misses", "coalesced", "evictions", "size"):
+    REGISTRY.gauge("weather_cache", "Weather cache counters", fn=lambda s=_stat: weather_cache.stats()[s], stat=_stat)
+for _stat in ("queue_depth", "batches", "rows", "max_batch_size", "rejected"):
+    REGISTRY.gauge("inference_batcher", "Micro-batching queue counters", fn=lambda s=_stat: batcher.stats()[s],
+                   stat=_stat)
+
+
+def today():
+    """
+    Returns the month (1-12) and the day of the week (1 is Monday)
+    """
+    now = datetime.datetime.now()
+    return now.month, now.isoweekday()
+
+
+def runtime(region):
+    """
+    Returns the inference engine and FWI state store of a region, given its index in regions
+    """
+    if region == 0:
+        return engine, state
+
+    def load():
+        r = regions[region]
+        os.makedirs(os.path.dirname(os.path.abspath(r.state)), exist_ok=True)
+        # keras keeps one session per process, which the main model owns
+        return InferenceEngine(r.weights, backend="numpy"), FWIStateStore(r.state, r.grid.shape())
+
+    return region_models.get(regions[region].name, load)
+
+
+def cell_weather(X, Y, lat, lon, region=0):
+    """
+    Returns the parsed weather for the grid cell (X, Y), fetching it at (lat, lon) on a cache miss
+    """
+    return weather_cache.get((int(region), int(X), int(Y)), lambda: parse_weather(fetch_weather(lat, lon)))
+
+
+def cells_weather(keys, coords):
+    """
+    Returns the parsed weather of many grid cells keyed (region, X, Y), or the exception fetching it
+    raised, with the cells missing from the cache fetched concurrently at coords, one (lat, lon) per key
+    """
+    where = dict(zip(keys, coords))
+
+    def fetch(missing):
+        return [j if isinstance(j, Exception) else parse_weather(j)
+                for j in fetch_many([where[key] for key in missing])]
+
+    return weather_cache.get_many(keys, fetch)
+
+
+def features(X, Y, month, day, lat, temp, rh, wind, rain, prev=(), out=None):
+    """
+    Builds the (n, 12) feature array in the column order of data.csv. prev optionally holds
+    the previous day's FFMC, DMC and DC. Unless out is given, the rows are written into this
+    thread's reusable buffer, which the next call overwrites
+    """
+    ffmc, dmc, dc, isi, rain = fire_indices(temp, rh, wind, rain, lat, month, *prev)
+    if out is None:
+        out = feature_buffer(np.broadcast(X, Y, lat, temp).size)
+    return fill_features(out, X, Y, month, day, ffmc, dmc, dc, isi, temp, rh, wind, rain)
+
+
+def advance_due(region, X, Y):
+    """
+    Returns True, and marks them as advanced now, if any of the cells of a region other than
+    Montesinho hasn't had its codes advanced by this process in the last WEATHER_TTL seconds
+    """
+    if region == 0:
+        return False
+    now = time.monotonic()
+    keys = [(region, x, y) for x, y in zip(np.ravel(X).tolist(), np.ravel(Y).tolist())]
+    with region_advanced_lock:
+        if all(now - region_advanced.get(key, -np.inf) < weather_cache.ttl for key in keys):
+            return False
+        region_advanced.update(dict.fromkeys(keys, now))
+    return True
+
+
+def score(X, Y, lat, weather, advance=False, region=0):
+    """
+    Returns the predicted area for arrays of cells of a region, given their (n, 4) parsed weather.
+    With advance=True today's moisture codes for the cells are also written to the state store,
+    which is how the grid refresh keeps Montesinho's codes. Other regions have no refresh, so their
+    cells are advanced here whenever advance_due() says so
+    """
+    advance = advance or advance_due(region, X, Y)
+    model, store = runtime(region)
+    month, day = today()
+    temp, rh, wind, rain = np.asarray(weather, dtype=np.float64).reshape(-1, 4).T
+    prev = store.previous(X, Y, datetime.date.today())
+    if advance:
+        codes = moisture_codes(temp, rh, wind, rain, lat, month, *prev)
+        store.advance(datetime.date.today(), X, Y, np.stack(codes, axis=-1))
+    with STAGES['fwi'].time():
+        data = features(X, Y, month, day, lat, temp, rh, wind, rain, prev)
+    with STAGES['model'].time():
+        predicted = batcher.predict(data) if region == 0 and batcher.window > 0 else model.predict(data)
+    return np.abs(predicted[:, 0])
+
+
+def fetch_cells(X, Y, lat, lon):
+    """
+    Fetches the weather of many cells in parallel. Returns an (n, 4) array of parsed weather,
+    with nan rows for cells that couldn't be fetched
+    """
+    weather = np.full((len(X), 4), np.nan)
+    for i, j in enumerate(fetch_many(list(zip(lat.tolist(), lon.tolist())))):
+        if not isinstance(j, Exception):
+            weather[i] = parse_weather(j)
+    return weather
+
+
+def render_raster(snapshot, width, height, bounds):
+    """
+    Predicts the area at the centre of every pixel of a (height, width) raster over
+    bounds = (south, west, north, east), with weather interpolated from the snapshot's cells.
+    The pixels inside the park are scored a block of rows (about RASTER_BLOCK pixels) at a time;
+    the rest are nan
+    """
+    south, west, north, east = bounds
+    area = np.full((height, width), np.nan)
+    month, day = today()
+    date = datetime.date.today()
+    rows = max(1, RASTER_BLOCK // width)
+    for top in range(0, height, rows):
+        n = min(rows, height - top)
+        # The block's own bounds, so its pixel centres are those of rows top to top + n of the raster
+        step = (north - south) / height
+        lat, lon = (a.ravel() for a in pixels((north - (top + n) * step, west, north - top * step, east), width, n))
+        inside = MONTESINHO.contains(lat, lon)
+        lat, lon = lat[inside], lon[inside]
+        if len(lat):
+            X, Y = MONTESINHO.cell(lat, lon)
+            temp, rh, wind, rain = interpolate(snapshot, lat, lon).T
+            prev = state.previous(X, Y, date)
+            data = features(X, Y, month, day, lat, temp, rh, wind, rain, prev, out=feature_batch(len(lat)))
+            area[top:top + n].reshape(-1)[inside] = np.abs(engine.predict(data)[:, 0])
+    return area
+
+
+def load_forecast():
+    """
+    Fetches the 3 hourly forecast of every grid cell, or reads it from FORECAST_FILE, which holds either
+    one forecast response for all the cells or {"cells": [{"X": ..., "Y": ..., "forecast": {...}}]}.
+    Returns the issue time, the first day and an (n, FORECAST_DAYS, 4) array of daily parsed weather,
+    with nan for the cells without a forecast
+    """
+    X, Y, lat, lon = MONTESINHO.cells()
+    if os.environ.get('FORECAST_FILE'):
+        with open(os.environ['FORECAST_FILE']) as f:
+            data = json.load(f)
+        if 'cells' in data:
+            by_cell = {(c['X'], c['Y']): c['forecast'] for c in data['cells']}
+            responses = [by_cell.get((x, y), KeyError((x, y))) for x, y in zip(X.tolist(), Y.tolist())]
+        else:
+            responses = [data] * len(X)
+    else:
+        responses = fetch_many(list(zip(lat.tolist(), lon.tolist())), url=FORECAST_URL)
+    ok = [j for j in responses if not isinstance(j, Exception)]
+    if not ok:
+        raise WeatherUnavailable("No forecast for any grid cell")
+    start = datetime.date.today()
+    weather = np.full((len(X), FORECAST_DAYS, 4), np.nan)
+    for i, j in enumerate(responses):
+        if not isinstance(j, Exception):
+            weather[i] = daily(j, start, FORECAST_DAYS)
+    return max(issued(j) for j in ok), start, weather
+
+
+scheduler = GridScheduler(MONTESINHO, fetch_cells,
+                          lambda X, Y, lat, weather: score(X, Y, lat, weather, advance=True),
+                          interval=float(os.environ.get('GRID_REFRESH', 600)),
+                          path=os.environ.get('GRID_SNAPSHOT', "./src/grid_snapshot.npz"),
+                          version=lambda: engine.version,
+                          rescore=lambda X, Y, lat, weather: score(X, Y, lat, weather))
+REGISTRY.gauge("grid_snapshot_age_seconds", "Age of the precomputed grid",
+               fn=lambda: time.time() - scheduler.snapshot.time if scheduler.snapshot is not None else float("nan"))
+
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+
+
+@app.after_request
+def record_request(resp):
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unknown"
+    REGISTRY.counter("http_requests_total", "HTTP requests served", endpoint=endpoint,
+                     status=resp.status_code).inc()
+    REGISTRY.histogram("http_request_seconds", "Time taken to serve HTTP requests",
+                       endpoint=endpoint).observe(time.perf_counter() - g.start)
+    return resp
+
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    return make_response(str(e), 503)
 
 
 @app.route("/")
@@ -27,83 +284,284 @@ def predict():
     Y is Latitude, X is Longitude
     :return:
     """
-    x1 = -7.182288
-    x2 = -6.515598
-    y2 = 41.992531
-    y1 = 41.732416
-    dates = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    c = list(map(float, request.args.get('c')[1:-1].split(",")))
-    now = datetime.datetime.now()
-    month = now.month
-    day = dates.index(now.strftime("%A")) + 1
-    if not (y1 <= c[0] <= y2):
-        return "Outside Bounds"
-    if not (x1 <= c[1] <= x2):
+    with STAGES['parse'].time():
+        c = list(map(float, request.args.get('c')[1:-1].split(",")))
+        region = region_index.find_one(c[0], c[1])
+    if region < 0:
+        OUTSIDE_BOUNDS.inc()
         return "Outside Bounds"
-    x_p = (x2 - x1) / 9
-    y_p = (y2 - y1) / 9
-    delta_x = c[0] - y1
-    delta_y = c[1] - x1
-    X = int(delta_x/x_p)
-    Y = int(delta_y/y_p)
-    print(X, Y)
-    url = "http://api.openweathermap.org/data/2.5/weather?lat={}&" \
-          "lon={}&appid=997248ab2a9c56c05cf48c93efca9b27".format(c[0], c[1])
-
-    j = json.load(urllib.request.urlopen(url))
-    temp = 0
-    wind = 0
-    rh = 0
-    rain = 0
-    ffmc = 0
-    dmc = 0
-    dc = 0
-    isi = 0
-    try:
-        temp = j['main']['temp'] - 273.15
-    except KeyError:
-        pass
+    X, Y = regions[region].grid.cell(c[0], c[1])
+
+    if region == 0:
+        with STAGES['snapshot'].time():
+            snapshot = scheduler.fresh()
+            area = snapshot.lookup(X, Y) if snapshot is not None else None
+        if area is not None:
+            resp = make_response(str(area))
+            resp.headers['X-Snapshot-Time'] = snapshot.timestamp()
+            resp.headers['X-Model-Version'] = str(snapshot.version)
+            return resp
+
+    # No precomputed grid for the point, so score it directly
     try:
-        wind = j['wind']['speed'] * 3.6
-    except KeyError:
-        pass
+        with STAGES['weather'].time():
+            weather = cell_weather(X, Y, c[0], c[1], region)
+    except (OSError, ValueError):
+        return jsonify(error="Weather Unavailable"), 503
+    area = score(X, Y, c[0], weather, region=region)
+    return str(float(area[0]))
+
+
+@app.route("/predict/batch", methods=['POST'])
+def predict_batch():
+    """
+    Scores many coordinates in one request. The body is a JSON list of [lat, lon] pairs,
+    either bare or as {"c": [...]}. Weather is fetched once per grid cell, the cells missing from
+    the cache concurrently, and all the points of a region are scored in one model call.
+    :return: {"results": [{"c": [lat, lon], "area": ...} or {"c": [lat, lon], "error": ...}]}
+    """
+    body = request.get_json(force=True, silent=True)
+    if isinstance(body, dict):
+        body = body.get('c')
     try:
-        rh = j['main']['humidity']
-    except KeyError:
-        pass
+        c = np.asarray(body, dtype=np.float64).reshape(-1, 2)
+    except (TypeError, ValueError):
+        return jsonify(error="Expected a JSON list of [lat, lon] pairs"), 400
+    lat, lon = c[:, 0], c[:, 1]
+
+    errors = np.full(len(c), None, dtype=object)
+    region = region_index.find(lat, lon)
+    inside = region >= 0
+    errors[~inside] = "Outside Bounds"
+    OUTSIDE_BOUNDS.inc(int((~inside).sum()))
+    X = np.zeros(len(c), dtype=np.int64)
+    Y = np.zeros(len(c), dtype=np.int64)
+    for r in np.unique(region[inside]):
+        points = region == r
+        X[points], Y[points] = regions[r].grid.cell(lat[points], lon[points])
+
+    # One weather lookup per cell, taken at the first point that falls in it
+    weather = np.full((len(c), 4), np.nan)
+    idx = np.flatnonzero(inside)
+    cells, first, inverse = np.unique(np.stack([region[idx], X[idx], Y[idx]], axis=1), axis=0,
+                                      return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    with STAGES['weather'].time():
+        values = cells_weather([(int(region[i]), int(X[i]), int(Y[i])) for i in idx[first]],
+                               [(float(lat[i]), float(lon[i])) for i in idx[first]])
+    for k, value in enumerate(values):
+        if isinstance(value, (OSError, ValueError)):
+            errors[idx[inverse == k]] = "Weather Unavailable"
+        elif isinstance(value, BaseException):
+            raise value
+        else:
+            weather[idx[inverse == k]] = value
+
+    # One model call per region
+    results = [{'c': [float(a), float(b)]} for a, b in c]
+    for r in np.unique(region[errors == None]):
+        ok = np.flatnonzero((errors == None) & (region == r))
+        for i, area in zip(ok, score(X[ok], Y[ok], lat[ok], weather[ok], region=int(r))):
+            results[i]['area'] = float(area)
+    for i in np.flatnonzero(errors != None):
+        results[i]['error'] = errors[i]
+    return jsonify(results=results)
+
+
+@app.route("/grid")
+def grid():
+    """
+    :return: the latest precomputed area of every grid cell as a JSON heatmap
+    """
+    snapshot = scheduler.snapshot
+    if snapshot is None:
+        return jsonify(error="Grid not computed yet"), 503
+    return jsonify(snapshot.to_json())
+
+
+@app.route("/raster")
+def raster():
+    """
+    Renders the predicted area over a lat/lon raster in vectorized row blocks. Query parameters:
+    size (e.g. 512 or 512x256), bbox (south,west,north,east, default the park bounds), format
+    (png or f32) and vmax (the area at the top of the PNG colour scale, default the raster's maximum).
+    Responses carry an ETag and Last-Modified, and conditional requests get 304 without rendering.
+    :return: a PNG image, transparent outside the park, or with format=f32 the raw little-endian
+    float32 areas row by row from the northern edge, nan outside the park
+    """
+    snapshot = scheduler.snapshot
+    if snapshot is None:
+        return jsonify(error="Grid not computed yet"), 503
     try:
-        rain = ((j['rain']['3h']) / 6) / ((742300000 / 9) ** 2)
-    except KeyError:
-        pass
+        size = [int(v) for v in request.args.get('size', '512').lower().split('x')]
+        width, height = size if len(size) == 2 else size * 2
+        bounds = (tuple(map(float, request.args['bbox'].split(','))) if 'bbox' in request.args
+                  else (MONTESINHO.y1, MONTESINHO.x1, MONTESINHO.y2, MONTESINHO.x2))
+        fmt = request.args.get('format', 'png')
+        vmax = float(request.args['vmax']) if 'vmax' in request.args else None
+        if not (0 < width <= RASTER_MAX and 0 < height <= RASTER_MAX) or len(bounds) != 4 \
+                or fmt not in ('png', 'f32'):
+            raise ValueError()
+    except ValueError:
+        return jsonify(error="Expected size=WxH (at most {0}x{0}), bbox=south,west,north,east, "
+                             "format=png|f32 and a numeric vmax".format(RASTER_MAX)), 400
+
+    # The raster only changes with the snapshot, the model, the day and the parameters
+    key = (snapshot.time, engine.weights, engine.loaded_at, datetime.date.today().toordinal(),
+           width, height, bounds, fmt, vmax)
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()
+    modified = datetime.datetime.fromtimestamp(int(max(snapshot.time, engine.loaded_at)), datetime.timezone.utc)
+    if etag in request.if_none_match or (not request.if_none_match and request.if_modified_since is not None
+                                         and request.if_modified_since >= modified):
+        resp = make_response("", 304)
+    else:
+        def render():
+            with RASTER_SECONDS.time():
+                area = render_raster(snapshot, width, height, bounds)
+            top = float(np.nanmax(area)) if np.isfinite(area).any() else 0.0
+            if fmt == 'png':
+                return png(colorize(area, top if vmax is None else vmax)), 'image/png', top
+            return area.astype('<f4').tobytes(), 'application/octet-stream', top
+
+        body, content_type, top = raster_cache.get(etag, render)
+        resp = make_response(body)
+        resp.headers['Content-Type'] = content_type
+        resp.headers['X-Raster-Size'] = '{}x{}'.format(width, height)
+        resp.headers['X-Raster-Bounds'] = ','.join(map(str, bounds))
+        resp.headers['X-Raster-Max'] = str(top)
+    resp.set_etag(etag)
+    resp.last_modified = modified
+    resp.headers['X-Snapshot-Time'] = snapshot.timestamp()
+    return resp
+
+
+@app.route("/forecast")
+def forecast():
+    """
+    Predicts the area of every grid cell for today and the following days (days=1-5, default 5).
+    The moisture codes are rolled forward from the state store one forecast day at a time, and
+    all the (cell, day) pairs are scored in one model call. Results are cached per forecast issue.
+    :return: {"issued": ..., "days": [dates], "cells": [{"X", "Y", "lat", "lon"}], "area": [[area per day] per cell]}
+    """
     try:
-        ffmc = FFMC(temp, rh, wind, j['rain']['3h'] * 8, 57.45)
-    except KeyError:
-        pass
+        days = int(request.args.get('days', FORECAST_DAYS))
+        if not 1 <= days <= FORECAST_DAYS:
+            raise ValueError()
+    except ValueError:
+        return jsonify(error="days must be between 1 and {}".format(FORECAST_DAYS)), 400
     try:
-        dmc = DMC(temp, rh, j['rain']['3h'] * 8, 146.2, c[0], month)
-    except KeyError:
-        pass
+        issue, start, weather = forecast_weather.get('montesinho', load_forecast)
+    except (OSError, ValueError, KeyError) as e:
+        return jsonify(error="Forecast unavailable: {}".format(e)), 503
+
+    def compute():
+        X, Y, lat, lon = MONTESINHO.cells()
+        dates = [start + datetime.timedelta(days=d) for d in range(days)]
+        data = rollout(X, Y, lat, dates, weather[:, :days], state.previous(X, Y, start))
+        area = np.abs(engine.predict(data.reshape(-1, data.shape[-1]))[:, 0]).reshape(days, -1).T
+        return {
+            'issued': datetime.datetime.fromtimestamp(issue, datetime.timezone.utc).isoformat(),
+            'days': [d.isoformat() for d in dates],
+            'cells': [{'X': int(x), 'Y': int(y), 'lat': float(a), 'lon': float(b)}
+                      for x, y, a, b in zip(X, Y, lat, lon)],
+            'area': [[None if np.isnan(v) else float(v) for v in row] for row in area],
+        }
+
+    return jsonify(forecast_results.get((issue, start, days, engine.weights, engine.loaded_at), compute))
+
+
+@app.route("/whatif", methods=['POST'])
+def whatif():
+    """
+    Shows how the predicted area at a point responds to changes in its inputs. The body is
+    {"c": [lat, lon], "perturb": {feature: [offsets], ...}}, with features named as in data.csv and
+    offsets in their units (temp in C, RH in %, wind in km/h, rain in mm over 3h). Weather offsets
+    carry through to FFMC, DMC, DC and ISI. Every combination of the offsets, and central differences
+    for all 12 features, are scored in one model call.
+    :return: {"base": {"area", "features"}, "axes": {feature: offsets}, "surface": areas nested in the
+    order of the axes, "sensitivity": {feature: change in area per unit of its offsets, so per mm over
+    3h for rain}}
+    """
+    body = request.get_json(force=True, silent=True)
     try:
-        dc = DC(temp, j['rain']['3h'] * 8, 434.25, c[0], month)
-    except KeyError:
-        pass
+        lat, lon = map(float, body['c'])
+        axes, offsets, rows = what_if.grid(body.get('perturb', {}))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error='Expected {"c": [lat, lon], "perturb": {feature: [offsets]}}: ' + str(e)), 400
+    region = region_index.find_one(lat, lon)
+    if region < 0:
+        OUTSIDE_BOUNDS.inc()
+        return jsonify(error="Outside Bounds"), 400
+    grid_ = regions[region].grid
+    X, Y = grid_.cell(lat, lon)
     try:
-        isi = ISI(wind, ffmc)
-    except KeyError:
-        pass
-
-    data = str(X) + "," + str(Y) + "," + str(month) + "," + str(day) + "," + str(ffmc) + "," + str(
-        dmc) + "," + str(dc) + "," + str(isi) + "," + str(temp) + "," + str(rh) + "," + str(wind) + ',' + str(
-        rain)
-    print(data)
-    model = build_model()
-    model.load_weights("./src/model_weights.h5")
-    data = np.array(list(map(float, data.split(",")))).reshape(-1, 1).T
-    predicted = model.predict(data)
-    K.clear_session()
-    return str(math.fabs(predicted[0][0]))
+        with STAGES['weather'].time():
+            weather = cell_weather(X, Y, lat, lon, region)
+    except (OSError, ValueError):
+        return jsonify(error="Weather Unavailable"), 503
+
+    model, store = runtime(region)
+    month, day = today()
+    prev = store.previous(X, Y, datetime.date.today())
+    sensitivity = what_if.sensitivity_offsets()
+    # Base row, then the surface, then the central difference rows
+    n = 1 + rows + 2 * len(COLUMNS)
+    with STAGES['fwi'].time():
+        data, rain = what_if.features(n, X, Y, month, day, lat, weather, prev,
+                                what_if.combine(({}, 1), (offsets, rows), (sensitivity, 2 * len(COLUMNS))),
+                                grid_.shape())
+    with STAGES['model'].time():
+        area = np.abs(model.predict(data)[:, 0])
+    return jsonify(c=[lat, lon],
+                   base={'area': float(area[0]), 'features': dict(zip(COLUMNS, data[0].tolist()))},
+                   axes={name: v.tolist() for name, v in axes.items()},
+                   surface=area[1:1 + rows].reshape([len(v) for v in axes.values()]).tolist(),
+                   sensitivity=what_if.sensitivities(data[1 + rows:], area[1 + rows:], rain[1 + rows:]))
+
+
+@app.route("/regions")
+def list_regions():
+    """
+    :return: the configured regions with their bounds (south, west, north, east) and grid size
+    """
+    return jsonify(regions=[r.to_json() for r in regions])
+
+
+@app.route("/stats")
+def stats():
+    """
+    :return: the weather cache and inference batching counters as JSON
+    """
+    return jsonify(weather_cache=weather_cache.stats(), batcher=batcher.stats(), region_models=region_models.stats())
+
+
+@app.route("/admin/model")
+def admin_model():
+    """
+    :return: the active model version, its load and warm-up times, the versions in the registry and
+    the time and model version of the grid snapshot /predict and /grid serve
+    """
+    snapshot = scheduler.snapshot
+    return jsonify(active=engine.info(), registry=models.path,
+                   snapshot=None if snapshot is None else {'time': snapshot.timestamp(), 'version': snapshot.version},
+                   versions=[version for version, _ in models.versions()],
+                   reloads=watcher.reloads, errors=watcher.errors, failed=watcher.failed)
+
+
+@app.route("/metrics")
+def metrics():
+    """
+    :return: stage timings, counters and process gauges in the Prometheus text format
+    """
+    resp = make_response(REGISTRY.render())
+    resp.headers['Content-Type'] = 'text/plain; version=0.0.4'
+    return resp
 
 
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 5000))
+    if scheduler.interval > 0:
+        scheduler.start()
+    if watcher.interval > 0:
+        watcher.start()
     app.run(host='0.0.0.0', port=port, threaded=False)
@@ -0,0 +1,78 @@
+"""
+Production entry point: serves main.app from several pre-forked gunicorn worker processes.
+
+main (and with it the model weights and the FWI tables) is imported once in the parent before
+forking, so the workers share those pages copy-on-write instead of each loading their own. The
+exception is MODEL_BACKEND=keras: a keras/TensorFlow session doesn't survive being forked, so then
+every worker imports main, and loads its own model, after the fork.
+
+Every worker runs the grid scheduler, but only the one holding the lock on GRID_SNAPSHOT + ".lock"
+fetches weather and rescores the grid; the others read the snapshot it writes to GRID_SNAPSHOT. So
+upstream weather traffic doesn't grow with the number of workers, and a recycled worker picks up the
+current snapshot instead of refreshing. Each worker has its own model, so each runs its own registry
+watcher, which only lists the local registry directory.
+Configured through the environment:
+
+    PORT              port to bind (default 5000)
+    WEB_CONCURRENCY   number of worker processes (default: number of CPUs)
+    THREADS           request threads per worker (default 8)
+    MAX_REQUESTS      requests after which a worker is recycled (default 2000, 0 disables it)
+    TIMEOUT           seconds a worker may stay silent before it is killed and replaced (default 30)
+    GRID_SNAPSHOT     file the grid snapshot is shared through (default ./src/grid_snapshot.npz)
+    MODEL_BACKEND     numpy (default) or keras, which turns off preloading
+"""
+import gc
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+class Server(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        import main
+        return main.app
+
+
+def pre_fork(server, worker):
+    # Objects created by the import in the parent are never freed, so keep the garbage collector
+    # from touching (and so copying) their pages in the workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import main
+    if main.scheduler.interval > 0:
+        main.scheduler.start()
+    if main.watcher.interval > 0:
+        main.watcher.start()
+
+
+def options():
+    max_requests = int(os.environ.get('MAX_REQUESTS', 2000))
+    return {
+        'bind': '0.0.0.0:{}'.format(os.environ.get('PORT', 5000)),
+        'workers': int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count())),
+        'worker_class': 'gthread',
+        'threads': int(os.environ.get('THREADS', 8)),
+        'preload_app': os.environ.get('MODEL_BACKEND', 'numpy') != 'keras',
+        'max_requests': max_requests,
+        # Spread the restarts out so the workers aren't all recycled at once
+        'max_requests_jitter': max_requests // 10,
+        'timeout': int(os.environ.get('TIMEOUT', 30)),
+        'graceful_timeout': 30,
+        'pre_fork': pre_fork,
+        'post_fork': post_fork,
+    }
+
+
+if __name__ == "__main__":
+    Server(options()).run()
@@ -0,0 +1,183 @@
+"""
+Backfills FFMC, DMC, DC, ISI, BUI and FWI over an archive of daily weather, for many stations at once.
+
+The input is a CSV or JSON lines (.jsonl) file with one record per station and day: station, date
+(YYYY-MM-DD), lat, temp (C at noon), rh (% at noon), wind (km/h at noon) and rain (mm over 24 hours).
+Records must be grouped by station, in any date order within a station. Stations are taken a block
+at a time: the block becomes a (stations, days) matrix and the recurrences advance one day at a time
+for every station in it with array operations, so the interpreter's cost is per day, not per record.
+A day missing from a station's record is nan in the output and its codes carry over unchanged.
+
+Each block is written as a columnar part file (see columnar.py) in the output directory, and then a
+checkpoint of the input rows done so far. Running the same command again resumes after the last
+completed block. Station names are kept in checkpoint.json; the station column holds their index.
+
+With --fast, FFMC and ISI come from the lookup tables of fwi_fast.py, within fwi_fast.MAX_ERROR. The
+tables are only used with --stations of fwi_fast.MIN_ROWS or more, below which they are no faster.
+
+Usage: python -m src.backfill weather.csv out/ [--stations 512] [--chunksize 200000]
+                              [--ffmc 85] [--dmc 6] [--dc 15] [--fast]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from src import fwi_fast, fwi_np
+from src.cli import write_json
+from src.columnar import ColumnWriter
+
+SCHEMA = [("station", "<i4"), ("date", "<i4"), ("temp", "<f4"), ("RH", "<f4"), ("wind", "<f4"), ("rain", "<f4"),
+          ("FFMC", "<f4"), ("DMC", "<f4"), ("DC", "<f4"), ("ISI", "<f4"), ("BUI", "<f4"), ("FWI", "<f4")]
+
+
+def read(path, chunksize, skip=0):
+    """Yields DataFrames of at most chunksize records, leaving out the first skip records"""
+    import pandas as pd
+
+    if path.endswith((".jsonl", ".json")):
+        reader = pd.read_json(path, lines=True, chunksize=chunksize, dtype={'station': str})
+    else:
+        # The C parser skips rows without building them
+        reader = pd.read_csv(path, chunksize=chunksize, dtype={'station': str}, skiprows=range(1, skip + 1))
+        skip = 0
+    for chunk in reader:
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        yield chunk.iloc[skip:]
+        skip = 0
+
+
+def blocks(frames, stations):
+    """Regroups a stream of DataFrames into DataFrames holding `stations` whole stations each"""
+    import pandas as pd
+
+    pending, starts, rows, last = [], [], 0, None
+    for frame in frames:
+        if not len(frame):
+            continue
+        ids = frame['station'].values
+        codes = pd.factorize(ids)[0]
+        # Rows where a station's run of records begins. The first station may carry on from the last frame
+        new = np.flatnonzero(np.r_[ids[0] != last, codes[1:] != codes[:-1]])
+        starts.extend((new + rows).tolist())
+        pending.append(frame)
+        rows += len(frame)
+        last = ids[-1]
+        # The last station may carry on into the next frame, so only cut before it
+        if len(starts) > stations:
+            data = pd.concat(pending, ignore_index=True)
+            while len(starts) > stations:
+                cut = starts[stations]
+                yield data.iloc[:cut]
+                data = data.iloc[cut:]
+                starts = [i - cut for i in starts[stations:]]
+            pending, rows = [data.reset_index(drop=True)], len(data)
+    if pending:
+        data = pd.concat(pending, ignore_index=True)
+        starts.append(len(data))
+        for i in range(0, len(starts) - 1, stations):
+            yield data.iloc[starts[i]:starts[min(i + stations, len(starts) - 1)]]
+
+
+def backfill(block, ffmc0, dmc0, dc0, kernels=fwi_np):
+    """Computes the six indices for every record of a block of stations
+
+    Returns the day number (days since 1970-01-01) of every record and an
+    (n, 6) array of FFMC, DMC, DC, ISI, BUI and FWI in the block's row order.
+    kernels is the module the index functions come from, fwi_np or fwi_fast.
+    """
+    import pandas as pd
+
+    station, names = pd.factorize(block['station'].values)
+    day = pd.to_datetime(block['date']).values.astype("datetime64[D]").astype(np.int64)
+    first = day.min()
+    col = day - first
+    weather = np.full((len(names), col.max() + 1, 4), np.nan)
+    weather[station, col] = block[['temp', 'rh', 'wind', 'rain']].values
+    lat = np.zeros(len(names))
+    lat[station] = block['lat'].values
+    months = (np.datetime64(int(first), "D") + np.arange(weather.shape[1])).astype("datetime64[M]").astype(np.int64) % 12 + 1
+
+    ffmc = np.full(len(names), float(ffmc0))
+    dmc = np.full(len(names), float(dmc0))
+    dc = np.full(len(names), float(dc0))
+    codes = np.full(weather.shape[:2] + (3,), np.nan)
+    for t, month in enumerate(months):
+        temp, rh, wind, rain = weather[:, t].T
+        ok = ~np.isnan(weather[:, t]).any(axis=1)
+        if not ok.any():
+            continue
+        ffmc = np.where(ok, kernels.FFMC(temp, rh, wind, rain, ffmc), ffmc)
+        dmc = np.where(ok, kernels.DMC(temp, rh, rain, dmc, lat, month), dmc)
+        dc = np.where(ok, kernels.DC(temp, rain, dc, lat, month), dc)
+        codes[ok, t] = np.stack([ffmc, dmc, dc], axis=1)[ok]
+
+    # The other three indices have no memory, so they're computed for all records in one go
+    ffmc, dmc, dc = codes[station, col].T
+    isi = kernels.ISI(weather[station, col, 2], ffmc)
+    bui = kernels.BUI(dmc, dc)
+    return day, np.stack([ffmc, dmc, dc, isi, bui, kernels.FWI(isi, bui)], axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill fire weather indices over daily station records")
+    parser.add_argument("input", help="CSV or .jsonl file of daily records, grouped by station")
+    parser.add_argument("out", help="output directory for the part files and checkpoint")
+    parser.add_argument("--stations", type=int, default=512, help="stations advanced together per block. Larger blocks are faster; memory is "
+                             "about 60 bytes per station and day spanned")
+    parser.add_argument("--chunksize", type=int, default=200000, help="records read at a time")
+    parser.add_argument("--ffmc", type=float, default=85.0, help="FFMC the day before each station's first day")
+    parser.add_argument("--dmc", type=float, default=6.0, help="DMC the day before each station's first day")
+    parser.add_argument("--dc", type=float, default=15.0, help="DC the day before each station's first day")
+    parser.add_argument("--fast", action="store_true", help="approximate FFMC and ISI with lookup tables")
+    args = parser.parse_args()
+    kernels = fwi_fast if args.fast else fwi_np
+
+    os.makedirs(args.out, exist_ok=True)
+    checkpoint_path = os.path.join(args.out, "checkpoint.json")
+    checkpoint = {'input': os.path.abspath(args.input), 'rows': 0, 'parts': 0, 'stations': [], 'done': False,
+                  'start': [args.ffmc, args.dmc, args.dc]}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            saved = json.load(f)
+        if saved['input'] != checkpoint['input'] or saved['start'] != checkpoint['start']:
+            raise SystemExit("{} belongs to another backfill, use a new output directory".format(checkpoint_path))
+        checkpoint = saved
+        if checkpoint['done']:
+            print("Already complete: {} rows in {} parts".format(checkpoint['rows'], checkpoint['parts']))
+            return
+        print("Resuming after {} rows".format(checkpoint['rows']))
+
+    index = {name: i for i, name in enumerate(checkpoint['stations'])}
+    start = time.time()
+    rows = 0
+    for block in blocks(read(args.input, args.chunksize, checkpoint['rows']), args.stations):
+        day, indices = backfill(block, args.ffmc, args.dmc, args.dc, kernels)
+        for name in block['station'].unique():
+            if name not in index:
+                index[name] = len(checkpoint['stations'])
+                checkpoint['stations'].append(name)
+        columns = {'station': block['station'].map(index).values, 'date': day,
+                   'temp': block['temp'].values, 'RH': block['rh'].values,
+                   'wind': block['wind'].values, 'rain': block['rain'].values}
+        columns.update(zip(("FFMC", "DMC", "DC", "ISI", "BUI", "FWI"), indices.T))
+        with ColumnWriter(os.path.join(args.out, "part-{:05d}.col".format(checkpoint['parts'])), SCHEMA) as writer:
+            writer.append(columns)
+        checkpoint['rows'] += len(block)
+        checkpoint['parts'] += 1
+        write_json(checkpoint_path, checkpoint)
+        rows += len(block)
+        print("\r{} rows, {:.0f} rows/s".format(checkpoint['rows'], rows / (time.time() - start)), end="", flush=True)
+
+    checkpoint['done'] = True
+    write_json(checkpoint_path, checkpoint)
+    print("\nWrote {} rows in {} parts to {} in {:.1f} s".format(checkpoint['rows'], checkpoint['parts'], args.out,
+                                                                 time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class Overloaded(Exception):
+    """Raised when the batching queue is full and a request is turned away"""
+
+    def __str__(self):
+        return "Inference queue is full"
+
+
+class _Request:
+    def __init__(self, rows):
+        self.rows = rows
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Groups concurrent predict calls into one batched forward pass
+
+    A worker thread takes the first waiting request, then keeps collecting
+    requests for up to `window` seconds or until `max_batch` rows are queued,
+    runs them through predict() as one array and hands each caller its slice.
+    At most `max_queue` requests can wait; past that predict() raises
+    Overloaded so callers can shed load instead of queueing without bound.
+    """
+
+    def __init__(self, predict, window=0.002, max_batch=64, max_queue=1024):
+        self._predict = predict
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.largest = 0
+        self.rejected = 0
+        self._thread = None
+
+    def start(self):
+        with self.lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def predict(self, data):
+        """Queues a (n, 12) array and blocks until its (n, 1) predictions are ready"""
+        self.start()
+        req = _Request(np.asarray(data, dtype=np.float32).reshape(-1, 12))
+        try:
+            self.queue.put_nowait(req)
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            raise Overloaded()
+        req.event.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        size = len(batch[0].rows)
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                req = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(req)
+            size += len(req.rows)
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect()
+            try:
+                result = self._predict(np.concatenate([req.rows for req in batch]))
+            except Exception as e:
+                for req in batch:
+                    req.error = e
+                    req.event.set()
+                continue
+            start = 0
+            for req in batch:
+                req.result = result[start:start + len(req.rows)]
+                start += len(req.rows)
+                req.event.set()
+            with self.lock:
+                self.batches += 1
+                self.rows += size
+                self.largest = max(self.largest, size)
+
+    def stats(self):
+        """Returns the queue depth, batch counts and batch sizes"""
+        with self.lock:
+            return {'queue_depth': self.queue.qsize(), 'batches': self.batches, 'rows': self.rows,
+                    'mean_batch_size': self.rows / self.batches if self.batches else 0.0,
+                    'max_batch_size': self.largest, 'rejected': self.rejected}
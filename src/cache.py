@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Pending:
+    """A fetch in progress that other callers for the same key can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class WeatherCache:
+    """Thread safe TTL cache keyed by grid cell, with request coalescing
+
+    Entries expire ttl seconds after they were fetched and the least recently
+    used entry is evicted once there are more than maxsize of them. When
+    several threads miss on the same key at once, only the first one calls
+    fetch() and the rest wait for its result (or its exception).
+    """
+
+    def __init__(self, ttl=600, maxsize=256, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key, fetch):
+        """Returns the cached value for key, calling fetch() to fill it on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.clock() - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            pending = self.pending.get(key)
+            leader = pending is None
+            if leader:
+                pending = self.pending[key] = _Pending()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = fetch()
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self.lock:
+                if pending.error is None:
+                    self._store(key, pending.value)
+                del self.pending[key]
+            pending.event.set()
+        return pending.value
+
+    def get_many(self, keys, fetch):
+        """Returns the cached values for keys, calling fetch(missing) once for all the misses
+
+        fetch takes the list of missed keys and returns a list with the value,
+        or the exception raised getting it, for each. Keys another caller is
+        already fetching are waited on, as in get(). Returns a list with the
+        value or the exception for each key; exceptions aren't cached.
+        """
+        results = [None] * len(keys)
+        missing, waiting = [], []
+        with self.lock:
+            now = self.clock()
+            for i, key in enumerate(keys):
+                entry = self.entries.get(key)
+                if entry is not None and now - entry[0] < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    results[i] = entry[1]
+                elif key in self.pending:
+                    self.coalesced += 1
+                    waiting.append((i, self.pending[key]))
+                else:
+                    pending = self.pending[key] = _Pending()
+                    self.misses += 1
+                    missing.append((i, key, pending))
+
+        if missing:
+            try:
+                values = fetch([key for _, key, _ in missing])
+            except BaseException as e:
+                values = [e] * len(missing)
+                raise
+            finally:
+                with self.lock:
+                    for (i, key, pending), value in zip(missing, values):
+                        if isinstance(value, BaseException):
+                            pending.error = value
+                        else:
+                            pending.value = value
+                            self._store(key, value)
+                        del self.pending[key]
+                        results[i] = value
+                for _, _, pending in missing:
+                    pending.event.set()
+
+        for i, pending in waiting:
+            pending.event.wait()
+            results[i] = pending.value if pending.error is None else pending.error
+        return results
+
+    def _store(self, key, value):
+        self.entries[key] = (self.clock(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Returns the hit, miss, coalesce and eviction counters and the current size"""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced,
+                    'evictions': self.evictions, 'size': len(self.entries)}
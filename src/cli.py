@@ -0,0 +1,33 @@
+"""Helpers shared by the command line tools: process pools for sweep.py and score.py, and the
+atomic JSON writes that backfill.py and incremental.py checkpoint with"""
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def write_json(path, data, indent=None):
+    """Writes data to path as JSON through a temporary file and a rename, so readers never see part of it"""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp, path)
+
+
+def _init_worker(initializer, initargs):
+    # One core per worker, the pool provides the parallelism
+    os.environ["OMP_NUM_THREADS"] = "1"
+    os.environ["TF_NUM_INTRAOP_THREADS"] = "1"
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def process_pool(workers, initializer=None, initargs=()):
+    """Returns a ProcessPoolExecutor whose workers use one thread each and run initializer(*initargs)
+
+    The workers are spawned rather than forked, since the keras backend
+    doesn't survive being forked.
+    """
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker, initargs=(initializer, initargs))
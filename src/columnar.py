@@ -0,0 +1,192 @@
+"""
+Typed, memory mappable columnar format for fire records, and chunked readers over it.
+
+Layout: 8 byte magic, little-endian uint64 header length, a JSON header (schema, row count,
+per-column min/max and the byte offset of every column), then each column as one contiguous
+little-endian array, aligned to 64 bytes. Columns are read with np.memmap, so only the pages
+being used are loaded.
+
+Usage: python -m src.columnar data.csv data.col [--chunksize 100000]
+"""
+import argparse
+import json
+import os
+import shutil
+import struct
+
+import numpy as np
+
+from src.features import COLUMNS, TARGET
+
+MAGIC = b"FFCOL\x00\x00\x01"
+ALIGN = 64
+
+# Types of the data.csv columns
+DATA_SCHEMA = [("X", "<i2"), ("Y", "<i2"), ("month", "<i2"), ("day", "<i2"),
+               ("FFMC", "<f4"), ("DMC", "<f4"), ("DC", "<f4"), ("ISI", "<f4"), ("temp", "<f4"),
+               ("RH", "<f4"), ("wind", "<f4"), ("rain", "<f4"), ("area", "<f4")]
+
+
+class ColumnWriter:
+    """Writes a columnar file chunk by chunk, so memory is bounded by the chunk size
+
+    Each column is appended to its own temporary file; close() writes the
+    header and concatenates them into the final file, which is then renamed
+    into place.
+    """
+
+    def __init__(self, path, schema=DATA_SCHEMA):
+        self.path = path
+        self.schema = [(name, np.dtype(dtype).str) for name, dtype in schema]
+        self.rows = 0
+        self.stats = {name: [None, None] for name, _ in self.schema}
+        self.parts = {name: open("{}.{}.part".format(path, name), "wb") for name, _ in self.schema}
+
+    def append(self, columns):
+        """Appends a chunk given as a mapping (dict or DataFrame) from column name to values"""
+        n = None
+        for name, dtype in self.schema:
+            values = np.ascontiguousarray(np.asarray(columns[name]), dtype=dtype)
+            if n is None:
+                n = len(values)
+            elif len(values) != n:
+                raise ValueError("Column {} has {} rows, expected {}".format(name, len(values), n))
+            if n:
+                lo, hi = self.stats[name]
+                self.stats[name] = [values.min().item() if lo is None else min(lo, values.min().item()),
+                                    values.max().item() if hi is None else max(hi, values.max().item())]
+            self.parts[name].write(values.tobytes())
+        self.rows += n or 0
+
+    def close(self):
+        for f in self.parts.values():
+            f.close()
+        columns = []
+        offset = 0
+        for name, dtype in self.schema:
+            columns.append({'name': name, 'dtype': dtype, 'offset': offset,
+                            'min': self.stats[name][0], 'max': self.stats[name][1]})
+            offset += -(-self.rows * np.dtype(dtype).itemsize // ALIGN) * ALIGN
+        header = {'version': 1, 'rows': self.rows, 'columns': columns}
+        # Column offsets are relative to the end of the header until its length is known
+        relative = [c['offset'] for c in columns]
+        start = 0
+        while True:
+            for column, rel in zip(columns, relative):
+                column['offset'] = start + rel
+            raw = json.dumps(header).encode()
+            end = -(-(len(MAGIC) + 8 + len(raw)) // ALIGN) * ALIGN
+            if end <= start:
+                break
+            start = end
+        raw = raw.ljust(start - len(MAGIC) - 8)
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as out:
+            out.write(MAGIC + struct.pack("<Q", len(raw)) + raw)
+            for column in columns:
+                out.seek(column['offset'])
+                part = "{}.{}.part".format(self.path, column['name'])
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out, 1 << 20)
+                os.remove(part)
+            out.truncate(max(out.tell(), start))
+        os.replace(tmp, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            for name, f in self.parts.items():
+                f.close()
+                os.remove("{}.{}.part".format(self.path, name))
+
+
+class ColumnarFile:
+    """Read only view of a columnar file. Columns are memory mapped on first use"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(path + " is not a columnar file")
+            size, = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(size))
+        self.rows = self.header['rows']
+        self.columns = {c['name']: c for c in self.header['columns']}
+        self._maps = {}
+
+    def column(self, name):
+        if name not in self._maps:
+            c = self.columns[name]
+            if self.rows == 0:
+                self._maps[name] = np.empty(0, dtype=c['dtype'])
+            else:
+                self._maps[name] = np.memmap(self.path, dtype=c['dtype'], mode="r",
+                                             offset=c['offset'], shape=(self.rows,))
+        return self._maps[name]
+
+    def chunks(self, names, size, start=0, stop=None):
+        """Yields dicts of arrays holding at most size rows of the named columns"""
+        stop = self.rows if stop is None else stop
+        for i in range(start, stop, size):
+            yield {name: np.array(self.column(name)[i:min(i + size, stop)]) for name in names}
+
+    def features(self, start, stop, out=None):
+        """Returns rows [start, stop) as an (n, 12) float32 feature array"""
+        from src.features import batch, fill
+
+        out = batch(stop - start) if out is None else out[:stop - start]
+        return fill(out, *[self.column(name)[start:stop] for name in COLUMNS])
+
+
+def convert_csv(csv_path, out_path, chunksize=100000, schema=DATA_SCHEMA):
+    """Converts a data.csv style file to the columnar format, reading chunksize rows at a time"""
+    import pandas as pd
+
+    with ColumnWriter(out_path, schema) as writer:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            writer.append(chunk)
+    return writer.rows
+
+
+def batches(path, batch_size=256, start=0, stop=None, shuffle=True, seed=19):
+    """Endless generator of (features, scaled target) batches for model.fit_generator
+
+    Only one batch is held in memory at a time. The target is min-max scaled
+    with the statistics stored in the header, as test.preprocess does for the
+    whole CSV. With shuffle, the batch order is shuffled every epoch, while
+    rows within a batch stay contiguous on disk.
+    """
+    data = ColumnarFile(path)
+    stop = data.rows if stop is None else stop
+    lo, hi = data.columns[TARGET]['min'], data.columns[TARGET]['max']
+    scale = 1.0 / (hi - lo) if hi != lo else 0.0
+    starts = np.arange(start, stop, batch_size)
+    rng = np.random.RandomState(seed)
+    while True:
+        if shuffle:
+            rng.shuffle(starts)
+        for i in starts:
+            j = min(i + batch_size, stop)
+            # A fresh array per batch, since fit_generator may queue several
+            X = data.features(i, j)
+            y = (np.asarray(data.column(TARGET)[i:j], dtype=np.float32) - lo) * scale
+            yield X, y
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a data.csv style file to the columnar format")
+    parser.add_argument("csv")
+    parser.add_argument("out")
+    parser.add_argument("--chunksize", type=int, default=100000)
+    args = parser.parse_args()
+    rows = convert_csv(args.csv, args.out, args.chunksize)
+    print("Wrote {} rows to {}".format(rows, args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import numpy as np
+
+
+class InferenceEngine:
+    """Keeps one loaded model in memory for the lifetime of the process
+
+    The model is loaded and warmed up once in the constructor, so each call to
+    predict() only pays for the forward pass. The backend is either "numpy"
+    (see numpy_model.py, no keras import) or "keras". Keras calls are
+    serialised with a lock since its session is shared between threads.
+
+    reload() can be called while requests are being served. With the numpy
+    backend the new model is loaded and warmed up off to the side and then
+    swapped in with one assignment, so requests already running finish on
+    the old model. Keras shares one session, so there the load holds the lock
+    and requests wait for it.
+    """
+
+    def __init__(self, weights="./src/model_weights.h5", backend="numpy", version=None):
+        if backend not in ("numpy", "keras"):
+            raise ValueError("Unknown backend: " + repr(backend))
+        self.weights = weights
+        self.backend = backend
+        self.version = version
+        self.lock = threading.Lock()
+        self.model = None
+        self.graph = None
+        self.load_time = 0.0
+        self.warmup_time = 0.0
+        self.loaded_at = None
+        self.reload()
+
+    def _load_keras(self, weights):
+        import tensorflow as tf
+        from keras import backend as K
+        from src.test import build_model
+
+        K.clear_session()
+        model = build_model()
+        model.load_weights(weights)
+        return model, tf.get_default_graph()
+
+    def _load_numpy(self, weights):
+        from src.numpy_model import NumpyModel
+
+        return NumpyModel(weights), None
+
+    def _warm_up(self, model, graph):
+        # Run once so the first request doesn't pay for graph finalisation
+        start = time.time()
+        _predict(model, graph, np.zeros((1, 12), dtype=np.float32))
+        return time.time() - start
+
+    def reload(self, weights=None, version=None):
+        """Reloads the weights from disk, optionally from a new path, tagged with a registry version"""
+        weights = self.weights if weights is None else weights
+        start = time.time()
+        if self.backend == "keras":
+            with self.lock:
+                model, graph = self._load_keras(weights)
+                warmup = self._warm_up(model, graph)
+                self._swap(weights, version, model, graph, start, warmup)
+        else:
+            model, graph = self._load_numpy(weights)
+            warmup = self._warm_up(model, graph)
+            with self.lock:
+                self._swap(weights, version, model, graph, start, warmup)
+
+    def _swap(self, weights, version, model, graph, start, warmup):
+        # predict() reads self.model once per call, so this is the switch over point
+        self.model, self.graph = model, graph
+        self.weights = weights
+        self.version = version
+        self.load_time = time.time() - start
+        self.warmup_time = warmup
+        self.loaded_at = time.time()
+
+    def _predict(self, data):
+        return _predict(self.model, self.graph, data)
+
+    def predict(self, data):
+        """Runs the forward pass on a (n, 12) array and returns a (n, 1) array"""
+        data = np.asarray(data).reshape(-1, 12)
+        if self.backend == "numpy":
+            # The numpy model holds no mutable state, so no lock is needed
+            return self.model.predict(data)
+        with self.lock:
+            return self._predict(data)
+
+    def info(self):
+        """Returns the active version, weights path and load timings"""
+        return {'version': self.version, 'weights': self.weights, 'backend': self.backend,
+                'load_seconds': self.load_time, 'warmup_seconds': self.warmup_time,
+                'loaded_at': self.loaded_at}
+
+
+def _predict(model, graph, data):
+    if graph is None:
+        return model.predict(data)
+    with graph.as_default():
+        return model.predict(data)
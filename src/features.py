@@ -0,0 +1,50 @@
+import threading
+
+import numpy as np
+
+# Column order of data.csv, which the models are trained and served with
+COLUMNS = ("X", "Y", "month", "day", "FFMC", "DMC", "DC", "ISI", "temp", "RH", "wind", "rain")
+TARGET = "area"
+N_FEATURES = len(COLUMNS)
+DTYPE = np.float32
+
+_local = threading.local()
+
+
+def batch(n):
+    """Allocates an uninitialised (n, 12) feature array"""
+    return np.empty((n, N_FEATURES), dtype=DTYPE)
+
+
+def buffer(n):
+    """Returns an (n, 12) view of a buffer owned by the calling thread
+
+    The buffer only grows, so steady state calls reuse it rather than
+    allocating a new (n, 12) array; the columns written into it are still
+    computed into temporaries. The view is overwritten by the thread's next
+    call, so use it before building another.
+    """
+    buf = getattr(_local, "buf", None)
+    if buf is None or len(buf) < n:
+        buf = _local.buf = batch(max(n, 2 * len(buf) if buf is not None else 1))
+    return buf[:n]
+
+
+def fill(out, X, Y, month, day, ffmc, dmc, dc, isi, temp, rh, wind, rain):
+    """Writes the 12 feature columns into out, broadcasting scalars down the rows. Returns out"""
+    out = out.reshape(-1, N_FEATURES)
+    for i, column in enumerate((X, Y, month, day, ffmc, dmc, dc, isi, temp, rh, wind, rain)):
+        out[:, i] = column
+    return out
+
+
+def row(*values):
+    """Returns one (1, 12) feature row from the values in COLUMNS order"""
+    if len(values) != N_FEATURES:
+        raise ValueError("Expected {} features, got {}".format(N_FEATURES, len(values)))
+    return fill(batch(1), *values)
+
+
+def from_frame(df):
+    """Returns the feature columns of a data.csv style DataFrame as an (n, 12) float32 array"""
+    return fill(batch(len(df)), *[df[name].values for name in COLUMNS])
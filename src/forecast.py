@@ -0,0 +1,75 @@
+import datetime
+import os
+
+import numpy as np
+
+from src.features import batch, fill
+from src.weather import fire_indices, moisture_codes
+
+FORECAST_URL = os.environ.get('FORECAST_URL', "http://api.openweathermap.org/data/2.5/forecast")
+
+
+def issued(j):
+    """Returns the Unix time of a forecast's first step, which moves on each time the forecast is reissued"""
+    return int(j['list'][0]['dt'])
+
+
+def daily(j, start, days):
+    """Reduces an OpenWeatherMap 3 hourly /forecast response to one row of parsed weather per day
+
+    Returns a (days, 4) array of temperature (C), humidity (%), wind (km/h)
+    and 3h rain (mm) for the local dates start, start + 1, ... Temperature,
+    humidity and wind are taken from the step closest to local noon, when the
+    indices are defined. Rain is the mean 3h rain over the day's steps, so the
+    x8 in moisture_codes() gives the daily total; steps without a rain entry
+    had none. A day with no rain entry at all gets a nan rain, like a current
+    weather response without one (see parse_weather()), so /forecast builds
+    the same features as /predict for the same weather. Days the forecast
+    doesn't reach are nan throughout.
+    """
+    offset = j.get('city', {}).get('timezone', 0)
+    out = np.full((days, 4), np.nan)
+    noon = np.full(days, np.inf)
+    rain = [[] for _ in range(days)]
+    reported = np.zeros(days, dtype=bool)
+    for step in j['list']:
+        local = datetime.datetime.fromtimestamp(step['dt'] + offset, datetime.timezone.utc)
+        d = (local.date() - start).days
+        if not 0 <= d < days:
+            continue
+        rain[d].append(step.get('rain', {}).get('3h', 0.0))
+        reported[d] |= '3h' in step.get('rain', {})
+        distance = abs(local.hour + local.minute / 60 - 12)
+        if distance < noon[d]:
+            try:
+                out[d, :3] = (step['main']['temp'] - 273.15, step['main']['humidity'], step['wind']['speed'] * 3.6)
+            except KeyError:
+                continue
+            noon[d] = distance
+    for d in range(days):
+        if reported[d]:
+            out[d, 3] = np.mean(rain[d])
+    return out
+
+
+def rollout(X, Y, lat, dates, weather, prev):
+    """Builds the feature rows of every (cell, day) pair of a forecast
+
+    weather is an (n, days, 4) array of parsed daily weather and prev the
+    FFMC, DMC and DC going into the first day. As in main.score(), the
+    features come from fire_indices(), which zeroes the codes of a day with a
+    nan rain, while the codes carried from each day to the next for all the
+    cells at once take that day as dry, as the state store does. A day with a
+    nan temperature, humidity or wind makes the rest of that cell's days nan.
+    Returns a (days, n, 12) array.
+    """
+    n, days = weather.shape[:2]
+    out = batch(days * n).reshape(days, n, -1)
+    for d, date in enumerate(dates):
+        temp, rh, wind, rain = weather[:, d].T
+        ffmc, dmc, dc, isi, rain_feature = fire_indices(temp, rh, wind, rain, lat, date.month, *prev)
+        missing = np.isnan(weather[:, d, :3]).any(axis=1)
+        ffmc, dmc, dc, isi = (np.where(missing, np.nan, v) for v in (ffmc, dmc, dc, isi))
+        fill(out[d], X, Y, date.month, date.isoweekday(), ffmc, dmc, dc, isi, temp, rh, wind, rain_feature)
+        prev = tuple(np.where(missing, np.nan, v) for v in moisture_codes(temp, rh, wind, rain, lat, date.month, *prev))
+    return out
@@ -0,0 +1,214 @@
+# NumPy array versions of the Fire Weather Index functions in fwi.py.
+#
+# Every function takes scalars or arrays for any argument, broadcasts them against each other and
+# returns an array of the broadcast shape. The `if` branches of the scalar functions are evaluated
+# for every element and then selected with masks, so the results match fwi.py element for element:
+#
+#    FFMC(17,42,25,0,85) = 87.692980092774448
+#    DMC(17,42,0,6,45.98,4) = 8.5450511359999997
+#    DC(17,0,15,45.98,4) = 19.013999999999999
+#    ISI(25,87.692980092774448) = 10.853661073655068
+#    BUI(8.5450511359999997,19.013999999999999) = 8.4904265358371838
+#    FWI(10.853661073655068,8.4904265358371838) = 10.096371392382368
+#    calcFWI(4,17,42,25,0,85,6,15,45.98) = 10.096371392382368
+
+
+import numpy as np
+
+from src.fwi import InvalidLatitude
+
+LfN = np.array([-1.6, -1.6, -1.6, 0.9, 3.8, 5.8, 6.4, 5.0, 2.4, 0.4, -1.6, -1.6])
+LfS = np.array([6.4, 5.0, 2.4, 0.4, -1.6, -1.6, -1.6, -1.6, -1.6, 0.9, 3.8, 5.8])
+
+# Rows are the latitude bands 46N, 20N, 20S and 40S
+DayLengths = np.array([
+    [6.5, 7.5, 9.0, 12.8, 13.9, 13.9, 12.4, 10.9, 9.4, 8.0, 7.0, 6.0],
+    [7.9, 8.4, 8.9, 9.5, 9.9, 10.2, 10.1, 9.7, 9.1, 8.6, 8.1, 7.8],
+    [10.1, 9.6, 9.1, 8.5, 8.1, 7.8, 7.9, 8.3, 8.9, 9.4, 9.9, 10.2],
+    [11.5, 10.5, 9.2, 7.9, 6.8, 6.2, 6.5, 7.4, 8.7, 10.0, 11.2, 11.8],
+])
+
+
+def _arrays(*args):
+    return np.broadcast_arrays(*[np.asarray(a, dtype=np.float64) for a in args])
+
+
+def FFMC(TEMP, RH, WIND, RAIN, FFMCPrev):
+    '''Calculates today's Fine Fuel Moisture Code for arrays of inputs
+    PARAMETERS
+    ----------
+    TEMP is the 12:00 LST temperature in degrees celsius
+    RH is the 12:00 LST relative humidity in %
+    WIND is the 12:00 LST wind speed in kph
+    RAIN is the 24-hour accumulated rainfall in mm, calculated at 12:00 LST
+    FFMCPrev is the previous day's FFMC'''
+
+    TEMP, RH, WIND, RAIN, FFMCPrev = _arrays(TEMP, RH, WIND, RAIN, FFMCPrev)
+    with np.errstate(all="ignore"):
+        RH = np.minimum(100.0, RH)
+        mo = 147.2 * (101.0 - FFMCPrev) / (59.5 + FFMCPrev)
+
+        rf = RAIN - .5
+        mr = mo + 42.5 * rf * np.exp(-100.0 / (251.0 - mo)) * (1.0 - np.exp(-6.93 / rf))
+        mr = np.where(mo <= 150.0, mr, mr + 0.0015 * (mo - 150.0) ** 2 * rf ** .5)
+        mo = np.where(RAIN > .5, np.minimum(mr, 250.0), mo)
+
+        tempTerm = 0.18 * (21.1 - TEMP) * (1.0 - np.exp(-0.115 * RH))
+        ed = 0.942 * RH ** 0.679 + 11.0 * np.exp((RH - 100.0) / 10.0) + tempTerm
+        ew = 0.618 * RH ** 0.753 + 10.0 * np.exp((RH - 100.0) / 10.0) + tempTerm
+
+        windTerm = 0.0694 * WIND ** .5
+        tempFactor = 0.581 * np.exp(0.0365 * TEMP)
+
+        ko = 0.424 * (1.0 - (RH / 100.0) ** 1.7) + windTerm * (1.0 - (RH / 100.0) ** 8)
+        kd = ko * tempFactor
+        dry = ed + (mo - ed) * 10.0 ** -kd
+
+        k1 = 0.424 * (1.0 - ((100.0 - RH) / 100.0) ** 1.7) + windTerm * (1.0 - ((100.0 - RH) / 100.0) ** 8)
+        kw = k1 * tempFactor
+        wet = ew - (ew - mo) * 10.0 ** -kw
+
+        m = np.where(mo > ed, dry, np.where(mo < ew, wet, mo))
+        return 59.5 * (250.0 - m) / (147.2 + m)
+
+
+def DMC(TEMP, RH, RAIN, DMCPrev, LAT, MONTH):
+    '''Calculates today's Duff Moisture Code for arrays of inputs
+    PARAMETERS
+    ----------
+    TEMP is the 12:00 LST temperature in degrees celsius
+    RH is the 12:00 LST relative humidity in %
+    RAIN is the 24-hour accumulated rainfall in mm, calculated at 12:00 LST
+    DMCPrev is the prevvious day's DMC
+    Lat is the latitude in decimal degrees of the location for which calculations are being made
+    Month is the month of Year (1..12) for the current day's calculations.'''
+
+    TEMP, RH, RAIN, DMCPrev = _arrays(TEMP, RH, RAIN, DMCPrev)
+    with np.errstate(all="ignore"):
+        RH = np.minimum(100.0, RH)
+        re = 0.92 * RAIN - 1.27
+        mo = 20.0 + np.exp(5.6348 - DMCPrev / 43.43)
+
+        b = np.where(DMCPrev <= 33.0, 100.0 / (0.5 + 0.3 * DMCPrev),
+                     np.where(DMCPrev <= 65.0, 14.0 - 1.3 * np.log(DMCPrev), 6.2 * np.log(DMCPrev) - 17.2))
+
+        mr = mo + 1000.0 * re / (48.77 + b * re)
+        pr = 244.72 - 43.43 * np.log(mr - 20.0)
+        DMCPrev = np.where(RAIN > 1.5, np.where(pr > 0.0, pr, 0.0), DMCPrev)
+
+        d1 = DayLength(LAT, MONTH)
+        k = np.where(TEMP > -1.1, 1.894 * (TEMP + 1.1) * (100.0 - RH) * d1 * 0.000001, 0.0)
+
+        return DMCPrev + 100.0 * k
+
+
+def DC(TEMP, RAIN, DCPrev, LAT, MONTH):
+    '''Calculates today's Drought Code for arrays of inputs
+    PARAMETERS
+    ----------
+    TEMP is the 12:00 LST temperature in degrees celsius
+    RAIN is the 24-hour accumulated rainfall in mm, calculated at 12:00 LST
+    DCPrev is the previous day's DC
+    LAT is the latitude in decimal degrees of the location for which calculations are being made
+    MONTH is the month of Year (1..12) for the current day's calculations.'''
+
+    TEMP, RAIN, DCPrev = _arrays(TEMP, RAIN, DCPrev)
+    with np.errstate(all="ignore"):
+        rd = 0.83 * RAIN - 1.27
+        Qo = 800.0 * np.exp(-DCPrev / 400.0)
+        Qr = Qo + 3.937 * rd
+        Dr = 400.0 * np.log(800.0 / Qr)
+        DCPrev = np.where(RAIN > 2.8, np.where(Dr > 0.0, Dr, 0.0), DCPrev)
+
+        Lf = DryingFactor(LAT, np.asarray(MONTH) - 1)
+
+        V = np.where(TEMP > -2.8, 0.36 * (TEMP + 2.8) + Lf, Lf)
+        V = np.where(V < 0.0, 0.0, V)
+
+        return DCPrev + 0.5 * V
+
+
+def ISI(WIND, FFMC):
+    '''Calculates today's Initial Spread Index for arrays of inputs
+    PARAMETERS
+    ----------
+    WIND is the 12:00 LST wind speed in kph
+    FFMC is the current day's FFMC'''
+
+    WIND, FFMC = _arrays(WIND, FFMC)
+    with np.errstate(all="ignore"):
+        fWIND = np.exp(0.05039 * WIND)
+        m = 147.2 * (101.0 - FFMC) / (59.5 + FFMC)
+        fF = 91.9 * np.exp(-0.1386 * m) * (1.0 + m ** 5.31 / 49300000.0)
+        return 0.208 * fWIND * fF
+
+
+def BUI(DMC, DC):
+    '''Calculates today's Buildup Index for arrays of inputs
+    PARAMETERS
+    ----------
+    DMC is the current day's Duff Moisture Code
+    DC is the current day's Drought Code'''
+
+    DMC, DC = _arrays(DMC, DC)
+    with np.errstate(all="ignore"):
+        U = np.where(DMC <= 0.4 * DC, 0.8 * DMC * DC / (DMC + 0.4 * DC),
+                     DMC - (1.0 - 0.8 * DC / (DMC + 0.4 * DC)) * (0.92 + (0.0114 * DMC) ** 1.7))
+        return np.maximum(U, 0.0)
+
+
+def FWI(ISI, BUI):
+    '''Calculates today's Fire Weather Index for arrays of inputs
+    PARAMETERS
+    ----------
+    ISI is the current day's ISI
+    BUI is the current day's BUI'''
+
+    ISI, BUI = _arrays(ISI, BUI)
+    with np.errstate(all="ignore"):
+        fD = np.where(BUI <= 80.0, 0.626 * BUI ** 0.809 + 2.0, 1000.0 / (25.0 + 108.64 * np.exp(-0.023 * BUI)))
+        B = 0.1 * ISI * fD
+        return np.where(B > 1.0, np.exp(2.72 * (0.434 * np.log(B)) ** 0.647), B)
+
+
+def DryingFactor(Latitude, Month):
+    '''Looks up the day length adjustment for the DC. Month is 0 based, as in fwi.DryingFactor'''
+
+    Latitude, Month = np.broadcast_arrays(np.asarray(Latitude), np.asarray(Month, dtype=np.intp))
+    return np.where(Latitude > 0, LfN[Month], LfS[Month])
+
+
+def DayLength(Latitude, MONTH):
+    '''Approximates the length of the day given month and latitude for arrays of inputs'''
+
+    Latitude, MONTH = np.broadcast_arrays(np.asarray(Latitude), np.asarray(MONTH, dtype=np.intp))
+    if np.any((Latitude > 90) | (Latitude < -90)) or np.any(np.isnan(Latitude)):
+        bad = Latitude[(Latitude > 90) | (Latitude < -90) | np.isnan(Latitude)]
+        raise InvalidLatitude(bad.flat[0])
+
+    band = np.where(Latitude > 33, 0, np.where(Latitude > 0.0, 1, np.where(Latitude > -30.0, 2, 3)))
+    return DayLengths[band, MONTH - 1]
+
+
+def calcFWI(MONTH, TEMP, RH, WIND, RAIN, FFMCPrev, DMCPrev, DCPrev, LAT):
+    '''Calculates today's FWI for arrays of inputs
+    PARAMETERS
+    ----------
+    MONTH is the numeral month, from 1 to 12
+    TEMP is the 12:00 LST temperature in degrees celsius
+    RH is the 12:00 LST relative humidity in %
+    WIND is the 12:00 LST wind speed in kph
+    RAIN is the 24-hour accumulated rainfall in mm, calculated at 12:00 LST
+    FFMCPrev is the previous day's FFMC
+    DMCPrev is the previous day's DCM
+    DCPrev is the previous day's DC
+    LAT is the latitude in decimal degrees of the location for which calculations are being made'''
+
+    ffmc = FFMC(TEMP, RH, WIND, RAIN, FFMCPrev)
+    dmc = DMC(TEMP, RH, RAIN, DMCPrev, LAT, MONTH)
+    dc = DC(TEMP, RAIN, DCPrev, LAT, MONTH)
+    isi = ISI(WIND, ffmc)
+    bui = BUI(dmc, dc)
+    fwi = FWI(isi, bui)
+
+    return fwi
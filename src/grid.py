@@ -0,0 +1,54 @@
+import numpy as np
+
+
+class Grid:
+    """Maps coordinates inside a park's bounding box to the (X, Y) cells used by the model
+
+    x1/x2 are the west/east longitudes and y1/y2 the south/north latitudes. The
+    cell mapping is the one the model was trained against in main.predict:
+    X comes from the latitude and Y from the longitude, each divided by a
+    step of 1/n of the other axis' span.
+    """
+
+    def __init__(self, x1, x2, y1, y2, n=9):
+        self.x1 = x1
+        self.x2 = x2
+        self.y1 = y1
+        self.y2 = y2
+        self.n = n
+        self.x_p = (x2 - x1) / n
+        self.y_p = (y2 - y1) / n
+
+    def contains(self, lat, lon):
+        """Returns a boolean array that is True where the coordinates are inside the bounds"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        return (self.y1 <= lat) & (lat <= self.y2) & (self.x1 <= lon) & (lon <= self.x2)
+
+    def cell(self, lat, lon):
+        """Returns the X and Y cell indices of the coordinates as integer arrays"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        X = ((lat - self.y1) / self.x_p).astype(np.int64)
+        Y = ((lon - self.x1) / self.y_p).astype(np.int64)
+        return X, Y
+
+    def shape(self):
+        """Returns the number of distinct X and Y cells that coordinates inside the bounds map to"""
+        X, Y = self.cell(self.y2, self.x2)
+        return int(X) + 1, int(Y) + 1
+
+    def cells(self):
+        """Returns the X, Y, centre latitude and centre longitude of every cell, as flat arrays
+
+        The centres are those of the part of each cell that lies inside the bounds.
+        """
+        nx, ny = self.shape()
+        X, Y = np.meshgrid(np.arange(nx), np.arange(ny), indexing="ij")
+        X, Y = X.ravel(), Y.ravel()
+        lat = (self.y1 + X * self.x_p + np.minimum(self.y1 + (X + 1) * self.x_p, self.y2)) / 2
+        lon = (self.x1 + Y * self.y_p + np.minimum(self.x1 + (Y + 1) * self.y_p, self.x2)) / 2
+        return X, Y, lat, lon
+
+
+MONTESINHO = Grid(-7.182288, -6.515598, 41.732416, 41.992531)
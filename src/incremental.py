@@ -0,0 +1,174 @@
+"""
+Incremental retraining: fine-tunes the current weights on rows appended to the CSV since the last run.
+
+A manifest next to the weights records how far into the CSV training has got (byte offset, row count
+and a hash of the last row consumed), plus the fixed target scaling. Each run:
+
+  1. checks the CSV still starts with what was consumed, then reads only the rows after the offset,
+  2. sets aside every row whose hash falls in the holdout fraction, adding it to the holdout
+     kept from earlier runs,
+  3. fine-tunes the current weights on the remaining new rows,
+  4. compares the old and new weights on the whole holdout, and only if the new ones are no worse
+     (within --tolerance) atomically replaces the weights and advances the manifest. Otherwise
+     nothing changes and the same rows are picked up again next time.
+
+The first run only writes the manifest; train with test.py first. The rows it covers are the ones the
+current weights were trained on, so none of them go into the holdout, which starts with the next run.
+
+Usage: python -m src.incremental [--data src/data.csv] [--weights src/model_weights.h5] [--epochs 5]
+                                 [--registry src/models]
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+from src.cli import write_json
+from src.features import COLUMNS, TARGET, batch, fill
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+HOLDOUT_FRACTION = 0.1
+
+
+def row_hash(line):
+    return hashlib.sha256(line.rstrip(b"\r\n")).hexdigest()
+
+
+def is_holdout(line):
+    # Decided by the row's content, so a row stays on the same side on every run
+    return int(row_hash(line)[:8], 16) < HOLDOUT_FRACTION * 0x100000000
+
+
+def arrays(header, lines):
+    """Parses CSV lines into an (n, 12) feature array and the raw target"""
+    rows = list(csv.reader(io.StringIO(b"".join(lines).decode())))
+    index = {name: i for i, name in enumerate(header)}
+    values = np.array(rows, dtype=np.float64).reshape(-1, len(header))
+    X = fill(batch(len(values)), *[values[:, index[name]] for name in COLUMNS])
+    return X, values[:, index[TARGET]]
+
+
+def read_new(path, manifest):
+    """Returns the header, the non-blank lines after the manifest's offset, the offset of the end of
+    the file and the bytes from the start of the last non-blank line to the end (None if there is none)
+    """
+    with open(path, "rb") as f:
+        header = next(csv.reader([f.readline().decode()]))
+        offset = manifest.get('offset', f.tell())
+        if manifest:
+            # The last consumed row must still end at the recorded offset
+            f.seek(max(0, offset - manifest['last_row_bytes']))
+            last = f.read(manifest['last_row_bytes'])
+            if row_hash(last) != manifest['last_row_sha256']:
+                raise ValueError("{} no longer matches the manifest, retrain from scratch".format(path))
+        f.seek(offset)
+        raw = f.readlines()
+        end = f.tell()
+    lines = [line for line in raw if line.strip()]
+    # The last row is checked by hashing the bytes before the next offset, blank lines after it included
+    last = max((i for i, line in enumerate(raw) if line.strip()), default=None)
+    return header, lines, end, None if last is None else b"".join(raw[last:])
+
+
+def evaluate(model, X, y):
+    return float(model.evaluate(X, y, verbose=0)) if len(X) else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune the model on newly appended rows")
+    parser.add_argument("--data", default=os.path.join(DIR, "data.csv"))
+    parser.add_argument("--weights", default=os.path.join(DIR, "model_weights.h5"))
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--lr", type=float, default=0.001, help="learning rate for fine-tuning")
+    parser.add_argument("--registry", help="also publish promoted weights to this model registry directory")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="relative holdout loss increase that still counts as no regression")
+    args = parser.parse_args()
+
+    manifest_path = args.weights + ".manifest.json"
+    holdout_path = args.weights + ".holdout.csv"
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    header, lines, end, tail = read_new(args.data, manifest)
+    if not lines:
+        print("No new rows since the last checkpoint")
+        return
+    holdout = [line for line in lines if is_holdout(line)]
+    train = [line for line in lines if not is_holdout(line)]
+
+    checkpoint = {
+        'data': os.path.abspath(args.data),
+        'offset': end,
+        'rows': manifest.get('rows', 0) + len(lines),
+        'last_row_bytes': len(tail),
+        'last_row_sha256': row_hash(tail),
+        'updated': time.time(),
+    }
+
+    def commit():
+        # Holdout rows are only kept once the checkpoint moves past them, so a rejected run leaves no trace
+        if holdout:
+            with open(holdout_path, "ab") as f:
+                f.writelines(line if line.endswith(b"\n") else line + b"\n" for line in holdout)
+        write_json(manifest_path, checkpoint, indent=2)
+
+    if not manifest:
+        # First run: fix the target scaling and mark everything so far as consumed. The current
+        # weights were trained on these rows, so none of them may judge the next ones
+        holdout = []
+        _, area = arrays(header, lines)
+        checkpoint.update(area_min=float(area.min()), area_max=float(area.max()), holdout_mse=None)
+        commit()
+        print("Manifest created at {} rows; later runs train on rows appended after these".format(checkpoint['rows']))
+        return
+
+    from keras import backend as K
+    from src.test import build_model
+
+    scale = manifest['area_max'] - manifest['area_min'] or 1.0
+    previous = []
+    if os.path.exists(holdout_path):
+        with open(holdout_path, "rb") as f:
+            previous = [line for line in f if line.strip()]
+    X_hold, y_hold = arrays(header, previous + holdout)
+    y_hold = (y_hold - manifest['area_min']) / scale
+
+    current = build_model(lr=args.lr)
+    current.load_weights(args.weights)
+    before = evaluate(current, X_hold, y_hold)
+
+    if train:
+        X, y = arrays(header, train)
+        current.fit(X, (y - manifest['area_min']) / scale, epochs=args.epochs, verbose=0)
+    after = evaluate(current, X_hold, y_hold)
+    print("{} new rows ({} train, {} holdout). Holdout MSE {:.6f} -> {:.6f}".format(
+        len(lines), len(train), len(holdout), before, after))
+
+    if np.isnan(before) or after <= before * (1 + args.tolerance):
+        # Same directory and extension, so the rename is atomic and keras picks the same format
+        tmp = os.path.join(os.path.dirname(os.path.abspath(args.weights)), ".tmp-" + os.path.basename(args.weights))
+        current.save_weights(tmp)
+        os.replace(tmp, args.weights)
+        checkpoint.update(area_min=manifest['area_min'], area_max=manifest['area_max'], holdout_mse=after)
+        commit()
+        print("Promoted new weights to", args.weights)
+        if args.registry:
+            from src.registry import ModelRegistry
+
+            version, path = ModelRegistry(args.registry).publish(args.weights)
+            print("Published version {} as {}".format(version, path))
+    else:
+        print("Holdout loss regressed, keeping the current weights")
+    K.clear_session()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import bisect
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from 100us to 10s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, v) for k, v in sorted(labels.items())) + "}"
+
+
+def _value(value):
+    value = float(value)
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class Counter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+    def samples(self, name, labels):
+        yield name + _labels(labels), self.value
+
+
+class Gauge:
+    """A value that is either set() directly or read from a function when rendered"""
+
+    def __init__(self, fn=None):
+        self.fn = fn
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        yield name + _labels(labels), self.fn() if self.fn is not None else self.value
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield name + "_bucket" + _labels(dict(labels, le=le)), cumulative
+        yield name + "_sum" + _labels(labels), total
+        yield name + "_count" + _labels(labels), cumulative
+
+
+class Registry:
+    """Holds named metrics and renders them in the Prometheus text exposition format
+
+    Asking for the same name and labels twice returns the same metric, so
+    modules can look their metrics up at import time and update them cheaply.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.help = {}
+
+    def _get(self, kind, cls, name, help, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.metrics:
+                self.metrics[key] = cls(**kwargs)
+                self.help[name] = (kind, help)
+            return self.metrics[key]
+
+    def counter(self, name, help="", **labels):
+        return self._get("counter", Counter, name, help, labels)
+
+    def gauge(self, name, help="", fn=None, **labels):
+        return self._get("gauge", Gauge, name, help, labels, fn=fn)
+
+    def histogram(self, name, help="", **labels):
+        return self._get("histogram", Histogram, name, help, labels)
+
+    def render(self):
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        lines = []
+        seen = set()
+        for (name, labels), metric in metrics:
+            if name not in seen:
+                seen.add(name)
+                kind, help = self.help[name]
+                lines.append("# HELP {} {}".format(name, help))
+                lines.append("# TYPE {} {}".format(name, kind))
+            for sample, value in metric.samples(name, dict(labels)):
+                lines.append("{} {}".format(sample, _value(value)))
+        return "\n".join(lines) + "\n"
+
+
+def rss():
+    """Returns the resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current RSS, in KiB on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+REGISTRY = Registry()
+REGISTRY.gauge("process_resident_memory_bytes", "Resident set size of the process", fn=rss)
+REGISTRY.gauge("process_start_time_seconds", "Unix time the process started").set(time.time())
@@ -0,0 +1,64 @@
+import numpy as np
+
+# Largest absolute difference allowed between this backend and Keras on the
+# same weights, asserted by bench/bench_numpy_model.py. Both run the forward
+# pass in float32.
+TOLERANCE = 1e-5
+
+
+def sigmoid(x):
+    with np.errstate(over="ignore"):
+        return 1.0 / (1.0 + np.exp(-x))
+
+
+class NumpyModel:
+    """NumPy forward pass for the Dense(12, sigmoid) -> Dense(1, linear) network
+
+    Loads either the Keras weights file written by test.py or the compact
+    .npz written by export(). Only numpy (and h5py for .h5 files) is needed,
+    so serving doesn't have to import keras or tensorflow.
+    """
+
+    def __init__(self, weights="./src/model_weights.h5"):
+        if weights.endswith(".npz"):
+            f = np.load(weights)
+            layers = [(f["w1"], f["b1"]), (f["w2"], f["b2"])]
+        else:
+            layers = self._read_h5(weights)
+        (self.w1, self.b1), (self.w2, self.b2) = [
+            (np.ascontiguousarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32)) for w, b in layers]
+        if self.w1.shape != (12, 12) or self.w2.shape != (12, 1):
+            raise ValueError("Unexpected layer shapes {} and {}".format(self.w1.shape, self.w2.shape))
+
+    @staticmethod
+    def _read_h5(path):
+        import h5py
+
+        layers = []
+        with h5py.File(path, "r") as f:
+            for name in f.attrs["layer_names"]:
+                group = f[name.decode() if isinstance(name, bytes) else name]
+                weight_names = [n.decode() if isinstance(n, bytes) else n for n in group.attrs["weight_names"]]
+                if weight_names:
+                    # Keras stores [kernel, bias] for every Dense layer
+                    layers.append(tuple(group[n][()] for n in weight_names))
+        return layers
+
+    def export(self, path):
+        """Writes the weights to a compact .npz file"""
+        np.savez(path, w1=self.w1, b1=self.b1, w2=self.w2, b2=self.b2)
+
+    def predict(self, data):
+        """Runs the forward pass on a (n, 12) array and returns a (n, 1) array"""
+        data = np.asarray(data, dtype=np.float32).reshape(-1, 12)
+        hidden = sigmoid(data @ self.w1 + self.b1)
+        return hidden @ self.w2 + self.b2
+
+
+if __name__ == "__main__":
+    import sys
+
+    model = NumpyModel(sys.argv[1] if len(sys.argv) > 1 else "model_weights.h5")
+    out = sys.argv[2] if len(sys.argv) > 2 else "model_weights.npz"
+    model.export(out)
+    print("Weights exported to:", out)
@@ -1,9 +1,10 @@
-import numpy as np
+import os
 import dill
 
-data = "2,2,3,7,89.3,51.3,102.2,9.6,11.5,39,5.8,0"
-data = np.array(list(map(float, data.split(",")))).reshape(-1,1).T
+from src.features import row
+
+data = row(2, 2, 3, 7, 89.3, 51.3, 102.2, 9.6, 11.5, 39, 5.8, 0)
 print(data.shape)
-svm_model = dill.load(open("model.pkl", "rb"))
+svm_model = dill.load(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.pkl"), "rb"))
 predicted = svm_model.predict(data)
 print(predicted)
@@ -0,0 +1,87 @@
+import struct
+import zlib
+
+import numpy as np
+
+# Colour ramp from low to high predicted area: green, yellow, orange, red
+RAMP = np.array([[26, 150, 65], [255, 255, 191], [253, 174, 97], [215, 25, 28]], dtype=np.float64)
+
+
+def pixels(bounds, width, height):
+    """Returns the latitude and longitude of every pixel centre as (height, width) arrays
+
+    bounds is (south, west, north, east). Row 0 is the northern edge, as in an image.
+    """
+    south, west, north, east = bounds
+    lat = north - (np.arange(height) + 0.5) * (north - south) / height
+    lon = west + (np.arange(width) + 0.5) * (east - west) / width
+    return np.meshgrid(lat, lon, indexing="ij")
+
+
+def interpolate(snapshot, lat, lon):
+    """Estimates the parsed weather at arbitrary points from the per-cell weather of a snapshot
+
+    Temperature, humidity and wind are bilinearly interpolated between cell
+    centres. Rain keeps the value of the cell the point falls in, including a
+    nan for "no rain reading", so each pixel gets the same rain handling as a
+    prediction for its cell. Cells missing from the snapshot take the mean
+    of the others. Returns an (..., 4) array.
+    """
+    table = snapshot.weather_table
+    nx, ny = table.shape[:2]
+    _, _, clat, clon = snapshot.grid.cells()
+    # Cell centres along each axis, which cells() gives clipped to the bounds
+    clat = clat.reshape(nx, ny)[:, 0]
+    clon = clon.reshape(nx, ny)[0, :]
+
+    smooth = table[..., :3].copy()
+    rain = table[..., 3].copy()
+    missing = np.isnan(smooth).any(axis=-1)
+    if (~missing).any():
+        smooth[missing] = smooth[~missing].mean(axis=0)
+        readings = rain[~missing][~np.isnan(rain[~missing])]
+        rain[missing] = readings.mean() if len(readings) else np.nan
+
+    fx = np.interp(lat, clat, np.arange(nx))
+    fy = np.interp(lon, clon, np.arange(ny))
+    x0 = np.minimum(fx.astype(np.int64), nx - 1)
+    y0 = np.minimum(fy.astype(np.int64), ny - 1)
+    x1 = np.minimum(x0 + 1, nx - 1)
+    y1 = np.minimum(y0 + 1, ny - 1)
+    tx = (fx - x0)[..., None]
+    ty = (fy - y0)[..., None]
+
+    out = np.empty(np.shape(lat) + (4,))
+    out[..., :3] = ((smooth[x0, y0] * (1 - ty) + smooth[x0, y1] * ty) * (1 - tx)
+                    + (smooth[x1, y0] * (1 - ty) + smooth[x1, y1] * ty) * tx)
+    cx, cy = snapshot.grid.cell(lat, lon)
+    out[..., 3] = rain[np.clip(cx, 0, nx - 1), np.clip(cy, 0, ny - 1)]
+    return out
+
+
+def colorize(area, vmax):
+    """Maps a (height, width) area array to RGBA on a log scale, transparent where it is nan"""
+    scaled = np.log1p(np.nan_to_num(area)) / np.log1p(vmax) if vmax > 0 else np.zeros(area.shape)
+    pos = np.clip(scaled, 0, 1) * (len(RAMP) - 1)
+    i = np.minimum(pos.astype(np.int64), len(RAMP) - 2)
+    t = (pos - i)[..., None]
+    rgba = np.empty(area.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = np.rint(RAMP[i] * (1 - t) + RAMP[i + 1] * t)
+    rgba[..., 3] = np.where(np.isnan(area), 0, 255)
+    return rgba
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+
+def png(rgba, level=6):
+    """Encodes a (height, width, 4) uint8 array as a PNG image"""
+    height, width = rgba.shape[:2]
+    # Every scanline starts with filter type 0 (none)
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+    return (b"\x89PNG\r\n\x1a\n"
+            + _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + _chunk(b"IDAT", zlib.compress(raw.tobytes(), level))
+            + _chunk(b"IEND", b""))
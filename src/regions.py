@@ -0,0 +1,94 @@
+import json
+import math
+import os
+
+import numpy as np
+
+from src.grid import Grid
+
+
+class Region:
+    """A park served by the API: its grid, and the weights and FWI state file used for it"""
+
+    def __init__(self, name, grid, weights=None, state=None):
+        self.name = name
+        self.grid = grid
+        self.weights = weights
+        self.state = state
+
+    def to_json(self):
+        return {'name': self.name, 'bounds': [self.grid.y1, self.grid.x1, self.grid.y2, self.grid.x2],
+                'n': self.grid.n}
+
+
+def load_regions(path, weights, state_dir):
+    """Reads regions from a JSON config file
+
+    The file holds {"regions": [{"name": ..., "bounds": [south, west, north,
+    east], "n": 9, "weights": ..., "state": ...}, ...]}. n defaults to 9, the
+    weights to the given default and the state file to <state_dir>/<name>.bin.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    regions = []
+    for entry in config['regions']:
+        south, west, north, east = map(float, entry['bounds'])
+        if not (south < north and west < east):
+            raise ValueError("Region {} has empty bounds".format(entry['name']))
+        regions.append(Region(entry['name'], Grid(west, east, south, north, int(entry.get('n', 9))),
+                              entry.get('weights', weights),
+                              entry.get('state', os.path.join(state_dir, entry['name'] + ".bin"))))
+    return regions
+
+
+class SpatialIndex:
+    """Uniform grid hash from coordinates to the region containing them
+
+    Every region is registered in each square bucket of `bucket` degrees that
+    its bounds overlap, so a lookup only tests the few regions sharing the
+    point's bucket instead of all of them. Where regions overlap, the one
+    listed first wins.
+    """
+
+    def __init__(self, regions, bucket=0.5):
+        self.regions = list(regions)
+        self.bucket = bucket
+        self.buckets = {}
+        for i, region in enumerate(self.regions):
+            g = region.grid
+            for a in range(math.floor(g.y1 / bucket), math.floor(g.y2 / bucket) + 1):
+                for b in range(math.floor(g.x1 / bucket), math.floor(g.x2 / bucket) + 1):
+                    self.buckets.setdefault((a, b), []).append(i)
+
+    def find_one(self, lat, lon):
+        """Returns the index of the region containing one coordinate, or -1"""
+        try:
+            key = (math.floor(lat / self.bucket), math.floor(lon / self.bucket))
+        except (ValueError, OverflowError):
+            # nan or infinite
+            return -1
+        for i in self.buckets.get(key, ()):
+            g = self.regions[i].grid
+            if g.y1 <= lat <= g.y2 and g.x1 <= lon <= g.x2:
+                return i
+        return -1
+
+    def find(self, lat, lon):
+        """Returns the index of the region containing each coordinate as an integer array, -1 where there is none"""
+        lat, lon = np.broadcast_arrays(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+        shape = lat.shape
+        lat, lon = lat.ravel(), lon.ravel()
+        found = np.full(lat.shape, -1, dtype=np.int64)
+        keys = np.nan_to_num(np.stack([np.floor(lat / self.bucket), np.floor(lon / self.bucket)], axis=1), nan=np.inf)
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for k, key in enumerate(unique):
+            candidates = self.buckets.get((key[0], key[1])) if np.isfinite(key).all() else None
+            if not candidates:
+                continue
+            points = np.flatnonzero(inverse == k)
+            for i in candidates:
+                hit = points[self.regions[i].grid.contains(lat[points], lon[points])]
+                found[hit] = i
+                points = points[found[points] < 0]
+        return found.reshape(shape)
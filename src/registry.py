@@ -0,0 +1,146 @@
+"""
+Directory of versioned model weights, and a watcher that hot swaps the serving model when a new version appears.
+
+Versions are files named v<number>.h5 or v<number>.npz; the highest number is the active one. Publishing
+copies the weights in under a temporary name and renames them, so the watcher never sees a partial file.
+
+Usage: python -m src.registry publish src/model_weights.h5 [--dir src/models]
+       python -m src.registry list [--dir src/models]
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+VERSION = re.compile(r"^v(\d+)\.(h5|npz)$")
+
+
+class ModelRegistry:
+    """Versioned weight files in one directory"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def versions(self):
+        """Returns (version, path) pairs, oldest first"""
+        if not os.path.isdir(self.path):
+            return []
+        found = []
+        for name in os.listdir(self.path):
+            match = VERSION.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.path, name)))
+        return sorted(found)
+
+    def latest(self):
+        """Returns the newest (version, path), or None if the registry is empty"""
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def publish(self, weights):
+        """Copies a weights file in as the next version and returns (version, path)"""
+        os.makedirs(self.path, exist_ok=True)
+        ext = os.path.splitext(weights)[1]
+        if ext not in (".h5", ".npz"):
+            raise ValueError("Weights must be a .h5 or .npz file: " + weights)
+        latest = self.latest()
+        version = latest[0] + 1 if latest else 1
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".publish-", suffix=ext)
+        try:
+            with os.fdopen(fd, "wb") as out, open(weights, "rb") as f:
+                shutil.copyfileobj(f, out, 1 << 20)
+                out.flush()
+                os.fsync(out.fileno())
+            path = os.path.join(self.path, "v{:04d}{}".format(version, ext))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return version, path
+
+
+class RegistryWatcher:
+    """Polls a registry in a background thread and reloads the engine when a newer version appears
+
+    The new model is loaded and warmed up by engine.reload() before it is
+    swapped in, so requests never see a half loaded model. A version that
+    fails to load is skipped until a newer one is published, and the engine
+    keeps serving the one it has. on_reload, if given, is called after
+    every successful swap.
+    """
+
+    def __init__(self, registry, engine, interval=10, on_reload=None):
+        self.registry = registry
+        self.engine = engine
+        self.interval = interval
+        self.on_reload = on_reload
+        self.reloads = 0
+        self.errors = 0
+        self.failed = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """Loads the latest version if it is newer than the active one. Returns True if it swapped"""
+        latest = self.registry.latest()
+        if latest is None:
+            return False
+        version, path = latest
+        if (self.engine.version is not None and version <= self.engine.version) or version == self.failed:
+            return False
+        try:
+            self.engine.reload(path, version=version)
+        except Exception as e:
+            self.errors += 1
+            self.failed = version
+            print("Loading model version {} failed: {}".format(version, e))
+            return False
+        self.reloads += 1
+        if self.on_reload is not None:
+            self.on_reload()
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.errors += 1
+                print("Model registry check failed:", e)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish or list versioned model weights")
+    parser.add_argument("command", choices=("publish", "list"))
+    parser.add_argument("weights", nargs="?")
+    parser.add_argument("--dir", default=os.path.join(DIR, "models"))
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.dir)
+    if args.command == "publish":
+        if args.weights is None:
+            parser.error("publish needs a weights file")
+        version, path = registry.publish(args.weights)
+        print("Published version {} as {}".format(version, path))
+    else:
+        for version, path in registry.versions():
+            print(version, path)
+
+
+if __name__ == "__main__":
+    main()
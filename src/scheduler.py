@@ -0,0 +1,217 @@
+import datetime
+import fcntl
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+class Snapshot:
+    """Predicted area and parsed weather for every cell of a grid, as computed by one GridScheduler refresh
+
+    version is the registry version of the model that scored it, None for
+    the fixed weights file.
+    """
+
+    def __init__(self, grid, X, Y, lat, lon, area, weather=None, version=None):
+        self.grid = grid
+        self.time = time.time()
+        self.version = version
+        self.X = X
+        self.Y = Y
+        self.lat = lat
+        self.lon = lon
+        self.area = area
+        nx, ny = grid.shape()
+        # nan where the cell's weather couldn't be fetched
+        self.table = np.full((nx, ny), np.nan)
+        self.table[X, Y] = area
+        self.weather_table = np.full((nx, ny, 4), np.nan)
+        if weather is not None:
+            self.weather_table[X, Y] = weather
+
+    def lookup(self, X, Y):
+        """Returns the area for cell (X, Y), or None if it isn't in the snapshot"""
+        value = self.table[int(X), int(Y)]
+        return None if np.isnan(value) else float(value)
+
+    def save(self, path):
+        """Writes the snapshot to path, replacing the file atomically"""
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".snapshot-", suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, time=self.time, X=self.X, Y=self.Y, lat=self.lat, lon=self.lon, area=self.area,
+                         weather=self.weather_table[self.X, self.Y],
+                         version=np.nan if self.version is None else self.version)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, grid, path):
+        """Reads a snapshot written by save()"""
+        with np.load(path) as f:
+            version = float(f['version'])
+            snapshot = cls(grid, f['X'], f['Y'], f['lat'], f['lon'], f['area'], f['weather'],
+                           None if np.isnan(version) else int(version))
+            snapshot.time = float(f['time'])
+        return snapshot
+
+    def timestamp(self):
+        return datetime.datetime.fromtimestamp(self.time, datetime.timezone.utc).isoformat()
+
+    def to_json(self):
+        return {
+            'time': self.timestamp(),
+            'version': self.version,
+            'bounds': {'x1': self.grid.x1, 'x2': self.grid.x2, 'y1': self.grid.y1, 'y2': self.grid.y2},
+            'area': [[None if np.isnan(v) else float(v) for v in row] for row in self.table],
+            'cells': [{'X': int(x), 'Y': int(y), 'lat': float(la), 'lon': float(lo), 'area': float(a)}
+                      for x, y, la, lo, a in zip(self.X, self.Y, self.lat, self.lon, self.area)],
+        }
+
+
+class GridScheduler:
+    """Recomputes the predicted area of every grid cell in a background thread
+
+    Each refresh fetches the weather of all the cells with one call to
+    fetch(X, Y, lat, lon), which returns an (n, 4) array of parsed weather
+    with nan rows for cells it couldn't fetch, then scores them in one call
+    to score(X, Y, lat, weather). The latest result is kept
+    in self.snapshot, which is replaced atomically.
+
+    With a path, the snapshot is shared between the processes of a host
+    through that file. Only the process holding an exclusive lock on
+    path + ".lock" refreshes; the others reload the file when it changes,
+    checking every poll seconds, and take over the lock if its holder exits.
+    A process that takes over, or starts next to a recent file, waits until
+    the file's snapshot is interval seconds old before refreshing.
+
+    version() returns the version of the model score() uses. Snapshots are
+    tagged with it, and fresh() ignores a snapshot scored by another version.
+    After a model reload, rescore_soon() has the refreshing process rescore
+    the snapshot's weather with rescore(X, Y, lat, weather), which defaults
+    to score, without fetching it again.
+    """
+
+    def __init__(self, grid, fetch, score, interval=600, path=None, poll=1.0, version=lambda: None,
+                 rescore=None):
+        self.grid = grid
+        self.fetch = fetch
+        self.score = score
+        self.interval = interval
+        self.path = path
+        self.poll = poll
+        self.version = version
+        self.rescore_fn = rescore or score
+        self.snapshot = None
+        self.errors = 0
+        self._lock_file = None
+        self._loaded = None
+        self._rescore = threading.Event()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        X, Y, lat, lon = self.grid.cells()
+        weather = self.fetch(X, Y, lat, lon)
+        ok = ~np.isnan(weather[:, :3]).any(axis=1)
+        self.errors += int((~ok).sum())
+        version = self.version()
+        area = self.score(X[ok], Y[ok], lat[ok], weather[ok]) if ok.any() else np.empty(0)
+        return self._publish(Snapshot(self.grid, X[ok], Y[ok], lat[ok], lon[ok], area, weather[ok], version))
+
+    def rescore(self):
+        """Rescores the current snapshot's weather with the current model, keeping its time"""
+        old = self.snapshot
+        if old is None:
+            return None
+        weather = old.weather_table[old.X, old.Y]
+        version = self.version()
+        area = self.rescore_fn(old.X, old.Y, old.lat, weather) if len(old.X) else np.empty(0)
+        snapshot = Snapshot(self.grid, old.X, old.Y, old.lat, old.lon, area, weather, version)
+        snapshot.time = old.time
+        return self._publish(snapshot)
+
+    def rescore_soon(self):
+        """Asks the background thread to rescore the snapshot, if this process is the one refreshing it"""
+        self._rescore.set()
+        self._wake.set()
+
+    def _publish(self, snapshot):
+        if self.path is not None:
+            snapshot.save(self.path)
+            self._loaded = os.stat(self.path).st_mtime_ns
+        self.snapshot = snapshot
+        return snapshot
+
+    def load(self):
+        """Picks up the shared snapshot file if another process has replaced it since the last call"""
+        if self.path is None:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded:
+            self.snapshot = Snapshot.load(self.grid, self.path)
+            self._loaded = mtime
+
+    def leader(self):
+        """Returns True if this process refreshes the snapshot, taking the lock if it is free"""
+        if self.path is None or self._lock_file is not None:
+            return True
+        f = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        # Held until the process exits
+        self._lock_file = f
+        return True
+
+    def fresh(self):
+        """Returns the latest snapshot, or None if there isn't one from the last two intervals scored by
+        the current model"""
+        snapshot = self.snapshot
+        if snapshot is None or time.time() - snapshot.time > 2 * self.interval or snapshot.version != self.version():
+            return None
+        return snapshot
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self.poll
+            try:
+                self.load()
+                if self.leader():
+                    if self._rescore.is_set():
+                        self._rescore.clear()
+                        self.rescore()
+                    due = self.snapshot.time + self.interval if self.snapshot is not None else 0
+                    if time.time() >= due:
+                        self.refresh()
+                        due = self.snapshot.time + self.interval
+                    wait = max(due - time.time(), 0)
+            except Exception as e:
+                self.errors += 1
+                wait = self.interval
+                print("Grid refresh failed:", e)
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="grid-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,150 @@
+"""
+Scores large feature files in the data.csv layout with the network or the SVR, across a process pool.
+
+The input is read a chunk at a time (a CSV, or a columnar file from columnar.py, which is memory
+mapped) and each chunk is scored as one batch by a worker process, which loads the model once when
+it starts. At most --inflight chunks are queued or being scored, and results are written in input
+order as they complete, so memory stays bounded by the chunk size whatever the input size. The output
+has one prediction per input row: the raw model output, as predict.py prints it.
+
+    --model numpy   the network through numpy_model.py (weights from --weights, .h5 or .npz)
+    --model keras   the network through keras (build_model from test.py)
+    --model svr     the SVR pickled by train.py (--weights defaults to src/model.pkl)
+
+Usage: python -m src.score input.csv predictions.csv [--model numpy] [--weights src/model_weights.h5]
+                           [--workers 4] [--chunksize 100000] [--inflight 8]
+"""
+import argparse
+import collections
+import multiprocessing
+import os
+import pickle
+import time
+
+import numpy as np
+
+from src.cli import process_pool
+from src.features import from_frame
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS = ("numpy", "keras", "svr")
+
+# The model of this worker process, loaded by init_worker
+_model = None
+
+
+def load(kind, weights):
+    """Returns a function from an (n, 12) float32 array to n predictions"""
+    if kind == "numpy":
+        from src.numpy_model import NumpyModel
+
+        model = NumpyModel(weights)
+        return lambda X: model.predict(X)[:, 0]
+    if kind == "keras":
+        from src.test import build_model
+
+        model = build_model()
+        model.load_weights(weights)
+        return lambda X: model.predict(X, batch_size=len(X))[:, 0]
+    if kind == "svr":
+        with open(weights, "rb") as f:
+            model = pickle.load(f)
+        return lambda X: model.predict(X)
+    raise ValueError("Unknown model: " + repr(kind))
+
+
+def init_worker(kind, weights):
+    global _model
+    _model = load(kind, weights)
+
+
+def score_chunk(X, text=False):
+    """Scores one chunk. With text, returns the predictions already formatted as CSV lines"""
+    predictions = np.asarray(_model(X), dtype=np.float32)
+    if text:
+        # Formatting costs more than a forward pass, so it's done here in parallel rather than by the writer
+        return "".join(["%.9g\n" % v for v in predictions.tolist()]).encode()
+    return predictions
+
+
+def chunks(path, chunksize):
+    """Yields (n, 12) float32 feature arrays of at most chunksize rows from a CSV or columnar file"""
+    if path.endswith(".col"):
+        from src.columnar import ColumnarFile
+
+        data = ColumnarFile(path)
+        for start in range(0, data.rows, chunksize):
+            yield data.features(start, min(start + chunksize, data.rows))
+    else:
+        import pandas as pd
+
+        for frame in pd.read_csv(path, chunksize=chunksize):
+            yield from_frame(frame)
+
+
+class Output:
+    """Writes predictions to a CSV, or with a .col path to a columnar file
+
+    For a CSV, write() takes the lines formatted by score_chunk(X, text=True).
+    """
+
+    def __init__(self, path):
+        self.text = not path.endswith(".col")
+        if self.text:
+            self.writer = None
+            self.file = open(path, "wb")
+            self.file.write(b"prediction\n")
+        else:
+            from src.columnar import ColumnWriter
+
+            self.writer = ColumnWriter(path, [("prediction", "<f4")])
+            self.file = None
+
+    def write(self, result):
+        if self.text:
+            self.file.write(result)
+        else:
+            self.writer.append({'prediction': result})
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        else:
+            self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a large feature file across a process pool")
+    parser.add_argument("input", help="CSV in the data.csv layout, or a .col file")
+    parser.add_argument("output", help="CSV, or a .col file, with one prediction per input row")
+    parser.add_argument("--model", choices=MODELS, default="numpy")
+    parser.add_argument("--weights", help="weights file (default src/model_weights.h5, or src/model.pkl for svr)")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=100000)
+    parser.add_argument("--inflight", type=int, help="chunks queued or being scored at once (default 2 per worker)")
+    args = parser.parse_args()
+    weights = args.weights or os.path.join(DIR, "model.pkl" if args.model == "svr" else "model_weights.h5")
+    inflight = args.inflight or 2 * args.workers
+
+    start = time.time()
+    rows = 0
+    output = Output(args.output)
+    with process_pool(args.workers, init_worker, (args.model, weights)) as pool:
+        pending = collections.deque()
+        for X in chunks(args.input, args.chunksize):
+            if len(pending) >= inflight:
+                # Wait on the oldest chunk, which keeps the output in input order
+                output.write(pending.popleft().result())
+            pending.append(pool.submit(score_chunk, X, output.text))
+            rows += len(X)
+            print("\r{} rows read, {:.0f} rows/s".format(rows, rows / (time.time() - start)), end="", flush=True)
+        while pending:
+            output.write(pending.popleft().result())
+    output.close()
+    seconds = time.time() - start
+    print("\nScored {} rows in {:.1f} s ({:.0f} rows/s) with {} workers".format(rows, seconds, rows / seconds,
+                                                                              args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import datetime
+import fcntl
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from src.weather import FFMC_PREV, DMC_PREV, DC_PREV
+
+MAGIC = b"FWIS"
+VERSION = 1
+
+# 64 byte header followed by a float64 array of shape (2, nx, ny, 3). The
+# first slice holds the codes going into `date` (yesterday's), the second the
+# codes at the end of `date`. The last axis is FFMC, DMC, DC.
+HEADER = np.dtype([("magic", "S4"), ("version", "<u4"), ("date", "<i8"),
+                   ("nx", "<u4"), ("ny", "<u4"), ("pad", "V40")])
+
+
+class FWIStateStore:
+    """Memory mapped store of each grid cell's FFMC, DMC and DC, carried over from day to day
+
+    Reads are O(1) lookups into the mapped file. advance() writes the codes
+    computed for a date; the first advance on a new day makes the previous
+    day's codes the new starting point. Every update writes a new file and
+    renames it over the old one, so a crash never leaves a half written store.
+
+    Several processes can share one path. Each call checks whether the file
+    was replaced since it was mapped and maps the new one if so, and
+    advance() starts from the file on disk while holding an exclusive lock
+    on path + ".lock", so no process writes over codes it hasn't seen.
+    """
+
+    def __init__(self, path, shape):
+        self.path = path
+        self.shape = tuple(shape)
+        self.lock = threading.Lock()
+        if not os.path.exists(path):
+            codes = np.empty((2,) + self.shape + (3,))
+            codes[...] = (FFMC_PREV, DMC_PREV, DC_PREV)
+            self._write(0, codes)
+        self._open()
+
+    def _open(self):
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            header = np.fromfile(f, dtype=HEADER, count=1)
+            if len(header) != 1 or header["magic"][0] != MAGIC or header["version"][0] != VERSION:
+                raise ValueError(self.path + " is not an FWI state file")
+            shape = (int(header["nx"][0]), int(header["ny"][0]))
+            if shape != self.shape:
+                raise ValueError("{} holds a {} grid, expected {}".format(self.path, shape, self.shape))
+            codes = np.memmap(f, dtype="<f8", mode="r", offset=HEADER.itemsize, shape=(2,) + self.shape + (3,))
+        # Swapped as one tuple so readers never see a date with the wrong codes. The inode and
+        # mtime tell whether another process has replaced the file since
+        self.current = (int(header["date"][0]), codes, (st.st_ino, st.st_mtime_ns))
+
+    def _reload(self):
+        """Maps the file again if another process replaced it, and returns the current (date, codes, stamp)"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return self.current
+        if (st.st_ino, st.st_mtime_ns) != self.current[2]:
+            self._open()
+        return self.current
+
+    def _write(self, date, codes):
+        header = np.zeros(1, dtype=HEADER)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["date"] = date
+        header["nx"], header["ny"] = self.shape
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header.tobytes())
+                f.write(np.ascontiguousarray(codes, dtype="<f8").tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @property
+    def date(self):
+        """The last date codes were written for, or None for a new store"""
+        date = self._reload()[0]
+        return datetime.date.fromordinal(date) if date else None
+
+    def previous(self, X, Y, date):
+        """Returns the FFMC, DMC and DC to use as the previous day's codes for cells (X, Y) on date"""
+        stored, codes, _ = self._reload()
+        date = date.toordinal()
+        if stored == date:
+            prev = codes[0, X, Y]
+        elif 0 < stored < date:
+            prev = codes[1, X, Y]
+        else:
+            prev = np.broadcast_to(np.array([FFMC_PREV, DMC_PREV, DC_PREV]), np.shape(X) + (3,))
+        return prev[..., 0], prev[..., 1], prev[..., 2]
+
+    def advance(self, date, X, Y, codes):
+        """Stores the (n, 3) codes computed for cells (X, Y) on date"""
+        with self.lock, open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._open()
+            stored, old, _ = self.current
+            date = date.toordinal()
+            if date < stored:
+                raise ValueError("State is already at {}".format(datetime.date.fromordinal(stored)))
+            new = np.array(old)
+            if date > stored:
+                if stored:
+                    new[0] = old[1]
+                new[1] = new[0]
+            new[1, X, Y] = codes
+            self._write(date, new)
+            self._open()
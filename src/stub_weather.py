@@ -0,0 +1,120 @@
+"""
+Local stand-in for the OpenWeatherMap /data/2.5/weather and /data/2.5/forecast endpoints, for testing
+latency and failure handling offline. Point the API at it with
+WEATHER_URL=http://127.0.0.1:8901/data/2.5/weather and FORECAST_URL=http://127.0.0.1:8901/data/2.5/forecast
+
+Usage: python -m src.stub_weather [--port 8901] [--latency 0.1] [--jitter 0.05] [--error-rate 0.05]
+                                  [--hang-rate 0.01] [--rain-rate 0.2]
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def weather(lat, lon, rain=False):
+    """Returns plausible current weather JSON that varies smoothly with the coordinate"""
+    j = {
+        'coord': {'lat': lat, 'lon': lon},
+        'main': {'temp': 288.15 + 8 * math.sin(lat * 7) + 4 * math.cos(lon * 5),
+                 'humidity': int(55 + 30 * math.sin(lon * 11))},
+        'wind': {'speed': 3.5 + 2.5 * math.cos(lat * 13)},
+        'name': 'Stub',
+        'cod': 200,
+    }
+    if rain:
+        j['rain'] = {'3h': round(abs(2 * math.sin(lat * lon)), 2)}
+    return j
+
+
+def forecast(lat, lon, rain_rate=0.0, start=None, steps=40):
+    """Returns a 5 day, 3 hourly forecast JSON starting at the last 3 hour mark before start (default now)"""
+    start = int(time.time() if start is None else start) // 10800 * 10800
+    steps_json = []
+    for i in range(steps):
+        t = start + i * 10800
+        # Warmer and drier in the afternoon
+        diurnal = math.sin((t % 86400) / 86400 * 2 * math.pi - math.pi / 2)
+        step = weather(lat, lon, random.random() < rain_rate)
+        step['main']['temp'] += 5 * diurnal
+        step['main']['humidity'] = int(min(100, max(5, step['main']['humidity'] - 15 * diurnal)))
+        step['dt'] = t
+        del step['name'], step['cod'], step['coord']
+        steps_json.append(step)
+    return {'cod': '200', 'cnt': steps, 'list': steps_json,
+            'city': {'name': 'Stub', 'coord': {'lat': lat, 'lon': lon}, 'timezone': 0}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        options = self.server.options
+        parts = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(parts.query)
+        with self.server.lock:
+            self.server.requests += 1
+
+        time.sleep(max(0.0, options['latency'] + random.uniform(-1, 1) * options['jitter']))
+        if random.random() < options['hang_rate']:
+            # Never answer, so clients have to rely on their timeouts
+            time.sleep(3600)
+            return
+        if parts.path not in ("/data/2.5/weather", "/data/2.5/forecast") or 'lat' not in query or 'lon' not in query:
+            return self._send(404, {'cod': '404', 'message': 'Not found'})
+        if random.random() < options['error_rate']:
+            return self._send(random.choice([429, 500, 502]), {'cod': '500', 'message': 'Injected error'})
+        lat, lon = float(query['lat'][0]), float(query['lon'][0])
+        if parts.path == "/data/2.5/forecast":
+            return self._send(200, forecast(lat, lon, options['rain_rate']))
+        self._send(200, weather(lat, lon, random.random() < options['rain_rate']))
+
+    def _send(self, status, body):
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start(port=0, latency=0.0, jitter=0.0, error_rate=0.0, hang_rate=0.0, rain_rate=0.0):
+    """Starts the stub server in a daemon thread and returns it. server.url is its weather endpoint"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.options = {'latency': latency, 'jitter': jitter, 'error_rate': error_rate,
+                      'hang_rate': hang_rate, 'rain_rate': rain_rate}
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.url = "http://127.0.0.1:{}/data/2.5/weather".format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenWeatherMap weather API")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- random seconds on top of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/5xx")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction of requests never answered")
+    parser.add_argument("--rain-rate", type=float, default=0.0, help="fraction of responses that report rain")
+    args = parser.parse_args()
+    server = start(args.port, args.latency, args.jitter, args.error_rate, args.hang_rate, args.rain_rate)
+    print("Serving stub weather on", server.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
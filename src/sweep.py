@@ -0,0 +1,172 @@
+"""
+Parallel k-fold cross-validation over a hyperparameter grid for the network in test.py.
+
+Every (configuration, fold) pair is one job on a process pool. The folds are split and preprocessed
+once and cached as .npy files, which the workers memory map. Each job seeds numpy, random and the
+backend from its configuration and fold, so reruns give the same scores. The results are written to
+a leaderboard, and the best configuration is retrained on the same split as test.train_model and its
+weights saved.
+
+Usage: python -m src.sweep [--hidden 6,12,24] [--activation sigmoid,relu,tanh]
+                           [--lr 0.001,0.01,0.1] [--epochs 20,50] [--folds 10] [--workers 4]
+                           [--out sweep]
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.cli import process_pool
+from src.features import TARGET, from_frame
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+PARAMS = ("hidden", "activation", "lr", "epochs")
+
+
+def job_seed(config, fold):
+    """Deterministic 32 bit seed for one (configuration, fold) job"""
+    key = json.dumps([config[p] for p in PARAMS] + [fold]).encode()
+    return int.from_bytes(hashlib.sha256(key).digest()[:4], "little")
+
+
+def seed_everything(seed):
+    import random
+    import tensorflow as tf
+
+    random.seed(seed)
+    np.random.seed(seed)
+    if hasattr(tf, "set_random_seed"):
+        tf.set_random_seed(seed)
+    else:
+        tf.random.set_seed(seed)
+
+
+def cache_folds(data, folds, cache):
+    """Splits and preprocesses the data once, saving every fold's arrays under cache/
+
+    The target is min-max scaled over the whole dataset, as in test.preprocess.
+    Returns the list of fold directories.
+    """
+    from sklearn.model_selection import KFold
+    from sklearn.preprocessing import MinMaxScaler
+
+    df = pd.read_csv(data)
+    X = from_frame(df)
+    y = MinMaxScaler().fit_transform(df[TARGET].values.reshape(-1, 1))[:, 0].astype(np.float32)
+    digest = hashlib.sha256(X.tobytes() + y.tobytes()).hexdigest()[:12]
+
+    dirs = []
+    # Same unshuffled split as cross_val_score(cv=folds) in test.cross_validate
+    for k, (train, val) in enumerate(KFold(n_splits=folds).split(X)):
+        path = os.path.join(cache, "{}-{}of{}".format(digest, k, folds))
+        if not os.path.exists(os.path.join(path, "y_val.npy")):
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, "X_train.npy"), X[train])
+            np.save(os.path.join(path, "y_train.npy"), y[train])
+            np.save(os.path.join(path, "X_val.npy"), X[val])
+            # Written last, so its presence marks a complete fold
+            np.save(os.path.join(path, "y_val.npy"), y[val])
+        dirs.append(path)
+    return dirs
+
+
+def run_job(config, fold, path):
+    """Trains one configuration on one cached fold and returns its validation MSE"""
+    from keras import backend as K
+    from src.test import build_model
+
+    seed_everything(job_seed(config, fold))
+    load = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+    start = time.time()
+    model = build_model(config["hidden"], config["activation"], config["lr"])
+    model.fit(load("X_train"), load("y_train"), epochs=config["epochs"], verbose=0)
+    mse = float(model.evaluate(load("X_val"), load("y_val"), verbose=0))
+    K.clear_session()
+    return dict(config, fold=fold, mse=mse, seconds=time.time() - start)
+
+
+def leaderboard(results):
+    """Averages the fold scores of each configuration, best first"""
+    rows = []
+    key = lambda r: tuple(r[p] for p in PARAMS)
+    for config, group in itertools.groupby(sorted(results, key=key), key=key):
+        scores = [r["mse"] for r in group]
+        rows.append(dict(zip(PARAMS, config), mean_mse=float(np.mean(scores)), std_mse=float(np.std(scores)),
+                         folds=len(scores)))
+    return sorted(rows, key=lambda r: r["mean_mse"])
+
+
+def train_best(config, data, out):
+    """Retrains the best configuration on test.train_model's split and saves its weights"""
+    from sklearn.model_selection import train_test_split
+    from src.test import build_model, preprocess
+
+    seed_everything(job_seed(config, -1))
+    X, y = preprocess(pd.read_csv(data))
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=19)
+    model = build_model(config["hidden"], config["activation"], config["lr"])
+    model.fit(X_train, y_train, epochs=config["epochs"], verbose=0, validation_data=(X_test, y_test))
+    path = os.path.join(out, "best_weights.h5")
+    model.save_weights(path)
+    return path, float(model.evaluate(X_test, y_test, verbose=0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel cross-validated hyperparameter sweep")
+    parser.add_argument("--data", default=os.path.join(DIR, "data.csv"))
+    parser.add_argument("--hidden", default="6,12,24")
+    parser.add_argument("--activation", default="sigmoid,relu,tanh")
+    parser.add_argument("--lr", default="0.001,0.01,0.1")
+    parser.add_argument("--epochs", default="20,50")
+    parser.add_argument("--folds", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--out", default="sweep")
+    args = parser.parse_args()
+
+    grid = [dict(zip(PARAMS, values)) for values in itertools.product(
+        [int(h) for h in args.hidden.split(",")], args.activation.split(","),
+        [float(lr) for lr in args.lr.split(",")], [int(e) for e in args.epochs.split(",")])]
+    os.makedirs(args.out, exist_ok=True)
+    folds = cache_folds(args.data, args.folds, os.path.join(args.out, "folds"))
+    jobs = [(config, k, path) for config in grid for k, path in enumerate(folds)]
+    print("{} configurations x {} folds = {} jobs on {} workers".format(len(grid), len(folds), len(jobs),
+                                                                       args.workers))
+
+    start = time.time()
+    with process_pool(args.workers) as pool:
+        futures = [pool.submit(run_job, *job) for job in jobs]
+        results = []
+        for i, future in enumerate(futures):
+            results.append(future.result())
+            print("\r{}/{} jobs done".format(i + 1, len(jobs)), end="", flush=True)
+    print("\nSweep took {:.1f} s".format(time.time() - start))
+
+    rows = leaderboard(results)
+    with open(os.path.join(args.out, "leaderboard.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(args.out, "results.json"), "w") as f:
+        json.dump(results, f, indent=2)
+
+    best = {p: rows[0][p] for p in PARAMS}
+    path, mse = train_best(best, args.data, args.out)
+    with open(os.path.join(args.out, "best.json"), "w") as f:
+        json.dump(dict(best, cv_mse=rows[0]["mean_mse"], holdout_mse=mse, weights=path), f, indent=2)
+
+    print("\nTop configurations:")
+    for row in rows[:5]:
+        print("  " + ", ".join("{}={}".format(p, row[p]) for p in PARAMS) +
+              "  mse={:.6f} +/- {:.6f}".format(row["mean_mse"], row["std_mse"]))
+    print("Best weights saved to:", path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import math
+import os
+import sys
+
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import LabelEncoder, MinMaxScaler
@@ -8,24 +12,26 @@ from keras.layers import Input, Dense
 from keras.optimizers import Adam
 from keras.wrappers.scikit_learn import KerasRegressor
 
+from src.features import TARGET, from_frame
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 def preprocess(df):
     np.random.seed(19)
 
     mms = MinMaxScaler()
-    df["area"] = mms.fit_transform(df["area"].values.reshape(-1, 1))
-
-    y = df.pop("area")
-    X = df
+    y = mms.fit_transform(df[TARGET].values.reshape(-1, 1))[:, 0]
+    X = from_frame(df)
 
     return X, y
 
 
-def build_model():
-    adam = Adam(lr=0.01)
+def build_model(hidden=12, activation="sigmoid", lr=0.01):
+    adam = Adam(lr=lr)
 
     fire_in = Input((12,))
-    dense = Dense(12, activation="sigmoid")(fire_in)
+    dense = Dense(hidden, activation=activation)(fire_in)
     dense = Dense(1, activation="linear")(dense)
 
     model = Model(inputs=fire_in, outputs=dense)
@@ -35,30 +41,46 @@ def build_model():
 
 def cross_validate(X, y):
     reg = KerasRegressor(build_fn=build_model, nb_epoch=20, verbose=0)
-    return cross_val_score(reg, X.values, y.values, cv=10)
+    return cross_val_score(reg, X, y, cv=10)
 
 
 def train_model(X, y):
-    X_train, X_test, y_train, y_test = train_test_split(X.values, y.values, test_size=0.2, random_state=19)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=19)
 
     model = build_model()
     model.fit(X_train, y_train, epochs=20, verbose=0, validation_data=(X_test, y_test))
     return model
 
 
+def train_streaming(path, batch_size=256, epochs=20):
+    """Trains from a columnar file (see columnar.py) one batch at a time, holding out the last 20% of rows"""
+    from src.columnar import ColumnarFile, batches
+
+    rows = ColumnarFile(path).rows
+    split = int(rows * 0.8)
+
+    model = build_model()
+    model.fit_generator(batches(path, batch_size, stop=split), steps_per_epoch=math.ceil(split / batch_size),
+                        epochs=epochs, verbose=0,
+                        validation_data=batches(path, batch_size, start=split, shuffle=False),
+                        validation_steps=math.ceil((rows - split) / batch_size))
+    return model
+
+
 def main():
-    df = pd.read_csv("data.csv")
-    df.columns = ["x_coord", "y_coord", "month", "day",
-                  "ffmc", "dmc", "dc", "isi", "temp",
-                  "rh", "wind", "rain", "area"]
+    if len(sys.argv) > 1 and sys.argv[1].endswith(".col"):
+        # Datasets converted with columnar.py are streamed rather than loaded
+        model = train_streaming(sys.argv[1])
+    else:
+        df = pd.read_csv(sys.argv[1] if len(sys.argv) > 1 else os.path.join(DIR, "data.csv"))
 
-    X, y = preprocess(df)
+        X, y = preprocess(df)
 
-    results = cross_validate(X, y)
-    print("\nMean Cross Validation Score:", np.mean(results))
+        results = cross_validate(X, y)
+        print("\nMean Cross Validation Score:", np.mean(results))
 
-    model = train_model(X, y)
-    model.save_weights("model_weights.h5")
+        model = train_model(X, y)
+    model.save_weights(os.path.join(DIR, "model_weights.h5"))
     print("\nModel weights saved to: 'model_weights.h5'")
 
 
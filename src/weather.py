@@ -0,0 +1,301 @@
+import asyncio
+import http.client
+import json
+import math
+import os
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src import fwi, fwi_fast, fwi_np
+from src.metrics import REGISTRY
+
+# FWI_FAST=1 computes the FFMC and ISI of large feature batches (fwi_fast.MIN_ROWS rows or more) from the
+# lookup tables in fwi_fast.py, within fwi_fast.MAX_ERROR. The codes kept in the state store stay exact
+fwi_kernels = fwi_fast if os.environ.get('FWI_FAST') else fwi_np
+if fwi_kernels is fwi_fast:
+    fwi_fast.load()
+
+URL = os.environ.get('WEATHER_URL', "http://api.openweathermap.org/data/2.5/weather")
+APPID = "997248ab2a9c56c05cf48c93efca9b27"
+
+# Previous day's codes used to seed the FFMC, DMC and DC recurrences
+FFMC_PREV = 57.45
+DMC_PREV = 146.2
+DC_PREV = 434.25
+
+
+MISSING = {field: REGISTRY.counter("weather_missing_field_total",
+                                   "Weather responses without a field, so a fallback value was used", field=field)
+           for field in ("temp", "humidity", "wind", "rain")}
+RETRIES = REGISTRY.counter("weather_retries_total", "Weather requests that failed and were retried")
+FAILURES = REGISTRY.counter("weather_failures_total", "Weather requests that failed after all their retries")
+
+
+class WeatherUnavailable(OSError):
+    """Raised when the weather for a coordinate couldn't be fetched, even after retrying"""
+
+
+class WeatherProvider:
+    """Source of OpenWeatherMap style weather JSON for coordinates
+
+    fetch() returns the JSON for one (lat, lon), or raises. fetch_many()
+    returns a list with the JSON, or the exception fetching it raised, for
+    each of many coordinates; this base version calls fetch() for them from
+    `concurrency` threads. url picks another endpoint of the same API, such
+    as the 3 hourly forecast, instead of the current weather.
+    """
+
+    concurrency = 16
+
+    def fetch(self, lat, lon, url=None):
+        raise NotImplementedError
+
+    def fetch_many(self, coords, url=None):
+        def one(coord):
+            try:
+                return self.fetch(coord[0], coord[1], url)
+            except Exception as e:
+                return e
+
+        if not coords:
+            return []
+        with ThreadPoolExecutor(min(self.concurrency, len(coords))) as pool:
+            return list(pool.map(one, coords))
+
+
+def _backoff(attempt, base):
+    # Exponential backoff with full jitter, so retries from many callers don't line up
+    return random.uniform(0, base * 2 ** attempt)
+
+
+class OpenWeatherMap(WeatherProvider):
+    """Blocking client for the OpenWeatherMap /data/2.5/weather endpoint
+
+    Every thread keeps its own keep-alive connection. Each attempt is bounded
+    by `timeout` seconds and failed attempts are retried `retries` times with
+    jittered exponential backoff before WeatherUnavailable is raised.
+    fetch_many() fetches through AsyncOpenWeatherMap with the same settings.
+    """
+
+    def __init__(self, url=URL, appid=APPID, timeout=5.0, retries=2, backoff=0.2, concurrency=16):
+        self.url = url
+        self.appid = appid
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.concurrency = concurrency
+        self.local = threading.local()
+
+    def _connection(self, scheme, host):
+        conns = getattr(self.local, "conns", None)
+        if conns is None:
+            conns = self.local.conns = {}
+        conn = conns.get((scheme, host))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = conns[scheme, host] = cls(host, timeout=self.timeout)
+        return conn
+
+    def _get(self, lat, lon, url):
+        parts = urllib.parse.urlsplit(url)
+        conn = self._connection(parts.scheme, parts.netloc)
+        query = urllib.parse.urlencode({'lat': lat, 'lon': lon, 'appid': self.appid})
+        try:
+            conn.request("GET", "{}?{}".format(parts.path, query))
+            resp = conn.getresponse()
+            body = resp.read()
+        except (OSError, http.client.HTTPException):
+            # Drop the connection, the next attempt opens a fresh one
+            conn.close()
+            del self.local.conns[parts.scheme, parts.netloc]
+            raise
+        if resp.status != 200:
+            raise WeatherUnavailable("Weather API returned HTTP {}".format(resp.status))
+        return json.loads(body)
+
+    def fetch(self, lat, lon, url=None):
+        for attempt in range(self.retries + 1):
+            try:
+                return self._get(lat, lon, url or self.url)
+            except (OSError, ValueError, http.client.HTTPException) as e:
+                if attempt == self.retries:
+                    FAILURES.inc()
+                    raise WeatherUnavailable("No weather for ({}, {}): {}".format(lat, lon, e))
+                RETRIES.inc()
+                time.sleep(_backoff(attempt, self.backoff))
+
+    def fetch_many(self, coords, url=None):
+        async def run():
+            async with AsyncOpenWeatherMap(url or self.url, self.appid, self.timeout, self.retries,
+                                           self.backoff, self.concurrency) as client:
+                return await client.fetch_many(coords)
+
+        return asyncio.run(run())
+
+
+class AsyncOpenWeatherMap:
+    """asyncio client for the OpenWeatherMap /data/2.5/weather endpoint
+
+    Uses one aiohttp session with a pooled connector of `concurrency`
+    connections; at most that many requests are in flight at once. Timeouts
+    and retries behave as in OpenWeatherMap. Use as an async context manager.
+    """
+
+    def __init__(self, url=URL, appid=APPID, timeout=5.0, retries=2, backoff=0.2, concurrency=16):
+        self.url = url
+        self.appid = appid
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.concurrency = concurrency
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        import aiohttp
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def _get(self, lat, lon):
+        params = {'lat': str(lat), 'lon': str(lon), 'appid': self.appid}
+        async with self.session.get(self.url, params=params) as resp:
+            if resp.status != 200:
+                raise WeatherUnavailable("Weather API returned HTTP {}".format(resp.status))
+            return json.loads(await resp.read())
+
+    async def fetch(self, lat, lon):
+        import aiohttp
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.semaphore:
+                    return await self._get(lat, lon)
+            except (OSError, ValueError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    FAILURES.inc()
+                    raise WeatherUnavailable("No weather for ({}, {}): {}".format(lat, lon, e))
+                RETRIES.inc()
+                await asyncio.sleep(_backoff(attempt, self.backoff))
+
+    async def fetch_many(self, coords):
+        """Fetches every (lat, lon) concurrently. Failed coordinates get their exception instead"""
+        return await asyncio.gather(*[self.fetch(lat, lon) for lat, lon in coords], return_exceptions=True)
+
+
+provider = OpenWeatherMap(timeout=float(os.environ.get('WEATHER_TIMEOUT', 5)))
+
+
+def fetch_weather(lat, lon):
+    """Returns the OpenWeatherMap current weather JSON for a coordinate"""
+    return provider.fetch(lat, lon)
+
+
+def fetch_many(coords, url=None):
+    """Fetches the weather for many (lat, lon) pairs in parallel through the provider
+
+    Returns a list with the JSON for each coordinate, or the exception that
+    fetching it raised. url picks another endpoint, as in WeatherProvider.
+    """
+    return provider.fetch_many(coords, url)
+
+
+def parse_weather(j):
+    """Returns temperature (C), relative humidity (%), wind (km/h) and 3h rain (mm)
+
+    Missing temperature, humidity and wind are reported as 0 and missing rain
+    as nan, which fire_indices() treats as "no rain reading".
+    """
+    temp = 0
+    wind = 0
+    rh = 0
+    rain = np.nan
+    try:
+        temp = j['main']['temp'] - 273.15
+    except KeyError:
+        MISSING['temp'].inc()
+    try:
+        wind = j['wind']['speed'] * 3.6
+    except KeyError:
+        MISSING['wind'].inc()
+    try:
+        rh = j['main']['humidity']
+    except KeyError:
+        MISSING['humidity'].inc()
+    try:
+        rain = j['rain']['3h']
+    except KeyError:
+        MISSING['rain'].inc()
+    return temp, rh, wind, rain
+
+
+def moisture_codes(temp, rh, wind, rain, lat, month,
+                   ffmc_prev=FFMC_PREV, dmc_prev=DMC_PREV, dc_prev=DC_PREV, kernels=fwi_np):
+    """Advances FFMC, DMC and DC by one day for arrays of parsed weather
+
+    A missing (nan) rain reading is taken as no rain. kernels is fwi_np, or
+    fwi_fast for codes that aren't carried over to the next day.
+    """
+    daily = np.nan_to_num(np.asarray(rain, dtype=np.float64)) * 8
+    ffmc = kernels.FFMC(temp, rh, wind, daily, ffmc_prev)
+    dmc = kernels.DMC(temp, rh, daily, dmc_prev, lat, month)
+    dc = kernels.DC(temp, daily, dc_prev, lat, month)
+    return ffmc, dmc, dc
+
+
+def _fire_indices_row(temp, rh, wind, rain, lat, month, ffmc_prev, dmc_prev, dc_prev):
+    """fire_indices() for one row, or None if an input is outside what the scalar code handles"""
+    temp, rh, wind, rain, lat, ffmc_prev, dmc_prev, dc_prev = (
+        np.asarray(v, dtype=np.float64).item() for v in (temp, rh, wind, rain, lat, ffmc_prev, dmc_prev, dc_prev))
+    month = np.asarray(month).item()
+    # Comparisons with nan are False, so any nan other than the rain goes to the array code
+    if not (math.isfinite(temp) and 0 <= rh < math.inf and 0 <= wind < math.inf and -90 <= lat <= 90
+            and month in range(1, 13) and 0 <= ffmc_prev <= 101 and 0 <= dmc_prev < math.inf
+            and 0 <= dc_prev < math.inf and not math.isinf(rain)):
+        return None
+    month = int(month)
+    if math.isnan(rain):
+        ffmc = dmc = dc = rain = 0.0
+    else:
+        daily = rain * 8
+        ffmc = fwi.FFMC(temp, rh, wind, daily, ffmc_prev)
+        dmc = fwi.DMC(temp, rh, daily, dmc_prev, lat, month)
+        dc = fwi.DC(temp, daily, dc_prev, lat, month)
+    return ffmc, dmc, dc, fwi.ISI(wind, ffmc), (rain / 6) / ((742300000 / 9) ** 2)
+
+
+def fire_indices(temp, rh, wind, rain, lat, month,
+                 ffmc_prev=FFMC_PREV, dmc_prev=DMC_PREV, dc_prev=DC_PREV):
+    """Computes the weather columns of the feature row for arrays of parsed weather
+
+    Returns ffmc, dmc, dc, isi and the rain feature. Where there is no rain
+    reading the moisture codes and the rain feature are 0, and ISI is
+    computed from that 0 FFMC, as the model was served originally. A single
+    row goes through the scalar functions of fwi.py, which are about 50x
+    faster than the array ones at that size, and comes back as floats.
+    """
+    if np.broadcast(temp, rh, wind, rain, lat, month, ffmc_prev, dmc_prev, dc_prev).size == 1:
+        row = _fire_indices_row(temp, rh, wind, rain, lat, month, ffmc_prev, dmc_prev, dc_prev)
+        if row is not None:
+            return row
+    rain = np.asarray(rain, dtype=np.float64)
+    missing = np.isnan(rain)
+    rain = np.where(missing, 0.0, rain)
+    ffmc, dmc, dc = moisture_codes(temp, rh, wind, rain, lat, month, ffmc_prev, dmc_prev, dc_prev, fwi_kernels)
+    ffmc = np.where(missing, 0.0, ffmc)
+    dmc = np.where(missing, 0.0, dmc)
+    dc = np.where(missing, 0.0, dc)
+    isi = fwi_kernels.ISI(wind, ffmc)
+    rain = (rain / 6) / ((742300000 / 9) ** 2)
+    return ffmc, dmc, dc, isi, rain
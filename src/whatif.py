@@ -0,0 +1,107 @@
+import numpy as np
+
+from src.features import COLUMNS, batch, fill
+from src.weather import fire_indices, fwi_kernels
+
+# Step of the central differences for each feature, in its own units
+STEPS = {'X': 1, 'Y': 1, 'month': 1, 'day': 1, 'FFMC': 1.0, 'DMC': 1.0, 'DC': 1.0, 'ISI': 0.1,
+         'temp': 1.0, 'RH': 1.0, 'wind': 1.0, 'rain': 0.1}
+MAX_ROWS = 100000
+
+
+def grid(perturbations):
+    """Expands {feature: [offsets]} into the axes, one flat offset array per feature and the row count
+
+    Every combination of the offsets is one row; with no axes there is one
+    unperturbed row. Raises ValueError for an unknown feature, an empty axis
+    or more than MAX_ROWS combinations.
+    """
+    axes = {}
+    for name, offsets in perturbations.items():
+        if name not in STEPS:
+            raise ValueError("Unknown feature {!r}, expected one of {}".format(name, ", ".join(COLUMNS)))
+        offsets = np.asarray(offsets, dtype=np.float64).reshape(-1)
+        if not len(offsets):
+            raise ValueError("No offsets given for " + name)
+        axes[name] = offsets
+    rows = int(np.prod([len(v) for v in axes.values()]))
+    if rows > MAX_ROWS:
+        raise ValueError("At most {} combinations are allowed".format(MAX_ROWS))
+    mesh = np.meshgrid(*axes.values(), indexing="ij") if axes else []
+    return axes, {name: m.reshape(-1) for name, m in zip(axes, mesh)}, rows
+
+
+def combine(*blocks):
+    """Stacks (offsets, rows) blocks into one offsets dict, with zeros for the features a block doesn't vary"""
+    names = {name for offsets, _ in blocks for name in offsets}
+    return {name: np.concatenate([offsets.get(name, np.zeros(rows)) for offsets, rows in blocks]) for name in names}
+
+
+def sensitivities(data, area, rain):
+    """Central differences of area over the rows made by sensitivity_offsets(), per feature
+
+    Each is per unit of the feature's offsets, so rain is per mm over 3h
+    rather than per unit of the scaled rain feature; rain is the rain in mm
+    of each row as returned by features(), nan for no reading. The step is
+    taken from the rows actually built, since clipping can shrink it, and a
+    missing reading counts as 0 mm. Features whose step clipped to nothing
+    get None.
+    """
+    result = {}
+    for i, name in enumerate(COLUMNS):
+        if name == 'rain':
+            step = float(np.nan_to_num(rain[2 * i])) - float(np.nan_to_num(rain[2 * i + 1]))
+        else:
+            step = float(data[2 * i, i]) - float(data[2 * i + 1, i])
+        result[name] = (float(area[2 * i]) - float(area[2 * i + 1])) / step if step else None
+    return result
+
+
+def sensitivity_offsets():
+    """Offsets of the rows for central differences: +step then -step for every feature"""
+    rows = 2 * len(COLUMNS)
+    offsets = {name: np.zeros(rows) for name in COLUMNS}
+    for i, name in enumerate(COLUMNS):
+        offsets[name][2 * i] = STEPS[name]
+        offsets[name][2 * i + 1] = -STEPS[name]
+    return offsets
+
+
+def features(n, X, Y, month, day, lat, weather, prev, offsets, shape):
+    """Builds n feature rows from one cell's base inputs, each with its own offsets
+
+    weather is the cell's parsed (temp, rh, wind, rain) and prev its previous
+    FFMC, DMC and DC. Offsets to the weather are applied before the indices
+    are recomputed, so FFMC, DMC, DC and ISI follow them. Offsets to FFMC,
+    DMC and DC are then added to the recomputed codes, with ISI recomputed
+    from the new FFMC, and an ISI offset is added last. Values are kept in
+    their valid ranges: X and Y within the grid's shape, month within 1..12
+    and day within 1..7. These are clipped rather than wrapped, so a central
+    difference at December or Sunday becomes one-sided instead of spanning
+    the whole year or week. A negative rain offset leaves a missing rain
+    reading missing, so at a point without one the rain difference is
+    one-sided from it rather than between two rows with made up readings.
+    Returns the (n, 12) features and the (n,) rain in mm used for each row.
+    """
+    get = lambda name: offsets.get(name, np.zeros(n))
+    temp, rh, wind, rain = weather
+    temp = temp + get('temp')
+    rh = np.clip(rh + get('RH'), 0, 100)
+    wind = np.maximum(wind + get('wind'), 0)
+    # A missing rain reading stays missing unless rain is perturbed upwards
+    keep = (get('rain') == 0) | ((get('rain') < 0) & np.isnan(rain))
+    rain = np.where(keep, rain, np.maximum(np.nan_to_num(rain) + get('rain'), 0))
+
+    ffmc, dmc, dc, isi, rain_feature = fire_indices(temp, rh, wind, rain, lat, month, *prev)
+    if 'FFMC' in offsets:
+        ffmc = np.clip(ffmc + get('FFMC'), 0, 101)
+        isi = fwi_kernels.ISI(wind, ffmc)
+    dmc = np.maximum(dmc + get('DMC'), 0)
+    dc = np.maximum(dc + get('DC'), 0)
+    isi = np.maximum(isi + get('ISI'), 0)
+
+    X = np.clip(X + get('X'), 0, shape[0] - 1)
+    Y = np.clip(Y + get('Y'), 0, shape[1] - 1)
+    month = np.clip(month + get('month'), 1, 12)
+    day = np.clip(day + get('day'), 1, 7)
+    return fill(batch(n), X, Y, month, day, ffmc, dmc, dc, isi, temp, rh, wind, rain_feature), rain